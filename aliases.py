@@ -0,0 +1,165 @@
+import re
+from collections import Counter
+
+_SEPARATORS = re.compile(r"[\W_]+")
+_SENTENCES = re.compile(r"[.!?:;*#\n]+")
+_WORDS = re.compile(r"[^\W\d_][\w'’-]*")
+_POSSESSIVE = re.compile(r"['’]s?$")
+
+# Capitalized words that start sentences or headings without naming anything
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her here his how i if in
+into is it its my no not of on or our she so that the their then there these
+they this those to was we were what when where which who why will with you your
+""".split())
+
+# Franchise and publisher names shared by many files, never one file's entity
+COMMON_TERMS = frozenset("""
+marvel mcu avengers endgame infinity cinematic universe comics studios disney sony
+""".split())
+
+
+def normalize(text):
+    """Canonical form for alias matching: casefolded words joined by single spaces"""
+    return " ".join(_SEPARATORS.sub(" ", text.casefold()).split())
+
+
+def padded(text):
+    """Normalize text once, padded so aliases only match whole words"""
+    return f" {normalize(text)} "
+
+
+def mentions(padded_text, aliases):
+    """Whether a padded() text contains any alias from a canonical table"""
+    return any(f" {alias} " in padded_text for alias in aliases)
+
+
+def alias_pattern(alias):
+    """Regex matching a canonical alias as whole words, however they are cased or separated"""
+    return r"\b" + r"[\W_]*".join(re.escape(word) for word in alias.split()) + r"\b"
+
+
+def alias_table(aliases):
+    """Deduplicated, sorted canonical aliases; multi-word ones also match written as one word"""
+    table = set()
+    for alias in aliases:
+        alias = normalize(alias)
+        if alias:
+            table.add(alias)
+            table.add(alias.replace(" ", ""))
+    return sorted(table)
+
+
+def name_mentions(text, max_words=3):
+    """Count runs of up to max_words capitalized words in text.
+
+    Returns a Counter of mentions per canonical name, and the set of names
+    seen at least once away from the start of a sentence.
+    """
+    counts = Counter()
+    mid_sentence = set()
+    for sentence in _SENTENCES.split(text):
+        run = []
+        for position, word in enumerate(_WORDS.findall(sentence) + [""]):
+            word = _POSSESSIVE.sub("", word)
+            if word[:1].isupper() and normalize(word) not in STOPWORDS:
+                run.append((position, normalize(word)))
+                continue
+            if 0 < len(run) <= max_words:
+                name = " ".join(w for _, w in run)
+                counts[name] += 1
+                if run[0][0] > 0:
+                    mid_sentence.add(name)
+            run = []
+    return counts, mid_sentence
+
+
+class DerivedAliases:
+    """Alias tables derived from the names each file mentions.
+
+    Every file's name_mentions are counted once when it is ingested. A file
+    whose table is derived gets the names it mentions at least min_count
+    times, at least once mid-sentence, less any name another file mentions
+    at least as often, any alias a predefined table already claims, and any
+    name with a COMMON_TERMS word. Nothing depends on the order files were
+    loaded in, and a change only re-derives the files sharing a name with it.
+    """
+
+    def __init__(self, min_count=2):
+        self.min_count = min_count
+        self.mentions = {}   # file key -> (Counter of name mentions, names seen mid-sentence)
+        self.files = {}      # name -> {file key: mentions}
+        self.derived = set()  # file keys whose tables are derived
+
+    def update(self, key, mentions, derive, taken):
+        """Record a file's name_mentions and return {file key: table} for every table that changed.
+
+        `taken` holds the aliases of the predefined tables.
+        """
+        affected = self._drop(key)
+        counts, _ = mentions
+        self.mentions[key] = mentions
+        for name, count in counts.items():
+            self.files.setdefault(name, {})[key] = count
+        if derive:
+            self.derived.add(key)
+            affected.add(key)
+        else:
+            # A predefined table may claim aliases from any derived one
+            affected |= self.derived
+        return self._derive(affected | self._sharing(counts), taken)
+
+    def remove(self, key, taken):
+        """Forget a file and return {file key: table} for the derived tables that changed"""
+        predefined = key in self.mentions and key not in self.derived
+        affected = self._drop(key)
+        if predefined:
+            affected |= self.derived
+        return self._derive(affected, taken)
+
+    def _drop(self, key):
+        """Forget a file's counts, returning the derived files that shared a name with it"""
+        self.derived.discard(key)
+        entry = self.mentions.pop(key, None)
+        if entry is None:
+            return set()
+        counts, _ = entry
+        for name in counts:
+            holders = self.files[name]
+            del holders[key]
+            if not holders:
+                del self.files[name]
+        return self._sharing(counts)
+
+    def _sharing(self, counts):
+        return {key for name in counts for key in self.files.get(name, ()) if key in self.derived}
+
+    def _derive(self, keys, taken):
+        tables = {}
+        for key in keys & self.derived:
+            counts, mid_sentence = self.mentions[key]
+            tables[key] = alias_table(
+                name for name, count in counts.items()
+                if count >= self.min_count and name in mid_sentence and len(name) > 2
+                and self._specific(key, name, count, taken)
+            )
+        return tables
+
+    def _specific(self, key, name, count, taken):
+        if name in taken or name.replace(" ", "") in taken:
+            return False
+        if any(word in COMMON_TERMS for word in name.split()):
+            return False
+        return all(mentions < count for other, mentions in self.files[name].items() if other != key)
+
+    def state_dict(self):
+        return {'mentions': dict(self.mentions), 'derived': sorted(self.derived)}
+
+    def load_state_dict(self, state):
+        self.mentions = {}
+        self.files = {}
+        self.derived = set(state['derived'])
+        for key, mentions in state['mentions'].items():
+            self.mentions[key] = mentions
+            for name, count in mentions[0].items():
+                self.files.setdefault(name, {})[key] = count
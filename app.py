@@ -1,9 +1,19 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, make_response
 from model import ForgettingLLM
+from uploads_watcher import UploadsWatcher
+from tenants import validate_tenant_id
+from scheduler import SchedulerBusy, QueueTimeout
+from evaluate import Evaluator, parse_modes
+from profiler import SamplingProfiler, PROFILE_FORMATS, list_profiles, profile_filename, prune_profiles
+from functools import wraps
 import json
 import os
+import itertools
 from werkzeug.utils import secure_filename
 from datetime import datetime
+import threading
+import time
+import uuid
 
 app = Flask(__name__)
 llm = ForgettingLLM()
@@ -22,6 +32,27 @@ ALLOWED_EXTENSIONS = {'txt', 'csv', 'xlsx'}
 
 ENTITIES_FILE = 'entities.json'
 
+# Seconds between uploads folder scans
+UPLOADS_SCAN_INTERVAL = 2.0
+
+EVAL_CHECKPOINT_FOLDER = 'eval_checkpoints'
+
+# Upper bound on worker threads one evaluation job may start
+MAX_EVAL_PARALLELISM = 16
+
+PROFILE_FOLDER = 'profiles'
+
+# Finished evaluation jobs kept for polling, the oldest are dropped first
+MAX_FINISHED_EVAL_JOBS = 50
+
+# Evaluation jobs by id
+eval_jobs = {}
+eval_jobs_lock = threading.Lock()
+
+# The running time-window profile capture, if any
+profile_window = {'name': None}
+profile_window_lock = threading.Lock()
+
 def load_chats():
     if os.path.exists(CHATS_FILE):
         with open(CHATS_FILE, 'r') as f:
@@ -45,11 +76,70 @@ def save_entities(entities):
     with open(ENTITIES_FILE, 'w') as f:
         json.dump(entities, f, indent=4)
 
+def request_tenant_id():
+    """Tenant named by the request's tenant_id field, the default tenant otherwise"""
+    data = request.get_json(silent=True) or {}
+    return validate_tenant_id(data.get('tenant_id') or request.values.get('tenant_id'))
+
+def tenant_scoped(view):
+    """Run a view against the forgetting set of the requesting tenant"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            tenant_id = request_tenant_id()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        with llm.use_tenant(tenant_id):
+            return view(*args, **kwargs)
+    return wrapper
+
+def profile_name(prefix):
+    return f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+def save_profile(profiler, name, fmt=None):
+    try:
+        filename = profiler.save(PROFILE_FOLDER, name, fmt or llm.config.profile_format)
+    except Exception as e:
+        print(f"Error saving profile {name}: {e}")
+        return None
+    prune_profiles(PROFILE_FOLDER, llm.config.max_saved_profiles)
+    return filename
+
+def profiled(view):
+    """Sample the handling thread's stacks when the X-Profile header or profile_requests is set"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get('X-Profile', '').lower()
+        if header not in ('1', 'true', 'yes') and not llm.config.profile_requests:
+            return view(*args, **kwargs)
+        profiler = SamplingProfiler(
+            thread_ids=[threading.get_ident()],
+            interval=llm.config.profile_interval_ms / 1000
+        ).start()
+        try:
+            response = make_response(view(*args, **kwargs))
+        finally:
+            profiler.stop()
+            filename = save_profile(profiler, profile_name(request.endpoint))
+        if filename:
+            response.headers['X-Profile-Id'] = filename
+        return response
+    return wrapper
+
+def tenant_upload_folder():
+    if llm.tenant is llm.default_tenant:
+        return app.config['UPLOAD_FOLDER']
+    folder = os.path.join(os.path.dirname(app.config['UPLOAD_FOLDER']), llm.tenant.upload_dir)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
 @app.route('/chat', methods=['POST'])
+@profiled
+@tenant_scoped
 def chat():
     data = request.json
     message = data.get('message', '')
@@ -75,7 +165,32 @@ def chat():
         end_color = '\033[0m'
         print(f"{color_map.get(type, '')}{timestamp} [{type.upper()}] {message}{end_color}")
     
-    response = llm.generate_response(message, chat_history, log_callback=log_callback)
+    deadline_ms = data.get('deadline_ms')
+    if deadline_ms is not None and (
+        isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0
+    ):
+        return jsonify({
+            'response': 'deadline_ms must be a positive number of milliseconds.',
+            'error': 'Invalid deadline_ms',
+            'chat_id': chat_id
+        }), 400
+    
+    # Admission control: generation waits for a scheduler slot or the request is shed
+    try:
+        with llm.admission(chat_id, timeout=deadline_ms / 1000 if deadline_ms else None):
+            response = llm.generate_response(message, chat_history, log_callback=log_callback)
+    except SchedulerBusy as e:
+        log_callback(f"Request shed: {e}", "warning")
+        result = jsonify({
+            'response': f"The server is busy, please try again in {e.retry_after} seconds.",
+            'error': str(e),
+            'chat_id': chat_id,
+            'retry_after': e.retry_after,
+            'debug_logs': debug_logs
+        })
+        result.status_code = 504 if isinstance(e, QueueTimeout) else 503
+        result.headers['Retry-After'] = str(e.retry_after)
+        return result
     
     return jsonify({
         'response': response,
@@ -84,6 +199,7 @@ def chat():
     })
 
 @app.route('/update-config', methods=['POST'])
+@profiled
 def update_config():
     try:
         data = request.json
@@ -92,7 +208,10 @@ def update_config():
             check_before_llm=data.get('check_before_llm'),
             similarity_threshold=data.get('similarity_threshold'),
             model_name=data.get('model_name'),
-            use_entities=data.get('use_entities')
+            use_entities=data.get('use_entities'),
+            retain_block_threshold=data.get('retain_block_threshold'),
+            retain_focus_threshold=data.get('retain_focus_threshold'),
+            profile_requests=data.get('profile_requests')
         )
         return jsonify({
             'success': True,
@@ -105,16 +224,20 @@ def update_config():
         }), 400
 
 @app.route('/chats', methods=['GET'])
+@profiled
 def get_chats():
     chats = load_chats()
     return jsonify(chats)
 
 @app.route('/upload-forgetting-set', methods=['POST'])
+@profiled
+@tenant_scoped
 def upload_forgetting_set():
     if 'files' not in request.files:
         return jsonify({'success': False, 'error': 'No files provided'})
     
     files = request.files.getlist('files')
+    upload_folder = tenant_upload_folder()
     uploaded_items = []
     errors = []
     
@@ -122,7 +245,7 @@ def upload_forgetting_set():
         if file.filename:
             try:
                 filename = file.filename
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                filepath = os.path.join(upload_folder, filename)
                 
                 # Save the file
                 file.save(filepath)
@@ -130,13 +253,18 @@ def upload_forgetting_set():
                 # Read the content and add to forgetting set
                 with open(filepath, 'r', encoding='utf-8') as f:
                     content = f.read().strip()
-                    if content:  # Only process non-empty files
-                        if llm.add_to_forgetting_set(content, filename):
-                            uploaded_items.append(filename)
-                        else:
-                            errors.append(f"Failed to process {filename}")
-                    else:
-                        errors.append(f"Empty file: {filename}")
+                if not content:  # Only process non-empty files
+                    errors.append(f"Empty file: {filename}")
+                    continue
+                if llm.tenant is llm.default_tenant:
+                    # Go through the watcher so its next scan doesn't ingest the file again
+                    loaded = uploads_watcher.sync(filename)
+                else:
+                    loaded = llm.add_to_forgetting_set(content, filename)
+                if loaded:
+                    uploaded_items.append(filename)
+                else:
+                    errors.append(f"Failed to process {filename}")
                 
             except Exception as e:
                 errors.append(f"Error processing {file.filename}: {str(e)}")
@@ -161,29 +289,39 @@ def upload_forgetting_set():
         })
 
 @app.route('/get-forgetting-set')
+@profiled
+@tenant_scoped
 def get_forgetting_set():
     try:
-        # Ensure uploaded_files exists
-        if not hasattr(llm, 'uploaded_files'):
-            llm.uploaded_files = []
-            
-        # Verify files still exist and update list if needed
-        valid_files = []
-        for file in llm.uploaded_files:
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], file['filename'])
-            if os.path.exists(filepath):
-                valid_files.append(file)
-            
-        # If files are missing, try to reload from directory
-        if len(valid_files) < len(llm.uploaded_files):
-            load_existing_files()
-            
-        return jsonify({'items': llm.uploaded_files})
+        # Paginated, metadata-only listing straight from the registry; the
+        # uploads watcher keeps it in sync with the directory
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        with llm.files_lock:
+            total = len(llm.uploaded_files)
+            page = list(itertools.islice(llm.uploaded_files.values(), offset, offset + limit))
+        items = [
+            {
+                'index': offset + i,
+                'filename': file['filename'],
+                'statements': file['statements'],
+                'size': file['size']
+            }
+            for i, file in enumerate(page)
+        ]
+        return jsonify({
+            'items': items,
+            'total': total,
+            'offset': offset,
+            'limit': limit
+        })
     except Exception as e:
         print(f"Error in get_forgetting_set: {e}")
-        return jsonify({'items': []})
+        return jsonify({'items': [], 'total': 0})
 
 @app.route('/delete-forgetting-item/<int:item_id>', methods=['DELETE'])
+@profiled
+@tenant_scoped
 def delete_forgetting_item(item_id):
     try:
         # Remove item from forgetting set
@@ -192,50 +330,208 @@ def delete_forgetting_item(item_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-# Load existing files from uploads folder
-def load_existing_files():
-    if not hasattr(llm, 'uploaded_files'):
-        llm.uploaded_files = []
-    
-    # Get list of files in uploads folder
-    files = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) 
-             if os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], f))]
-    
-    # Add each file to the forgetting set if not already present
-    for filename in files:
-        # Check if file is already in uploaded_files
-        if not any(item['filename'] == filename for item in llm.uploaded_files):
-            try:
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:  # Only process non-empty files
-                        success = llm.add_to_forgetting_set(content, filename)
-                        if success:
-                            print(f"Loaded existing file: {filename}")
-                        else:
-                            print(f"Failed to load file: {filename}")
-            except Exception as e:
-                print(f"Error loading existing file {filename}: {e}")
+@app.route('/delete-forgetting-file/<path:filename>', methods=['DELETE'])
+@profiled
+@tenant_scoped
+def delete_forgetting_file(filename):
+    if llm.remove_file(filename):
+        return jsonify({'success': True})
+    return jsonify({'success': False, 'error': f'Unknown file: {filename}'})
 
-# Load existing files on startup
-load_existing_files()
+@app.route('/dedupe-forgetting-set', methods=['POST'])
+@profiled
+@tenant_scoped
+def dedupe_forgetting_set():
+    data = request.get_json(silent=True) or {}
+    threshold = data.get('threshold')
+    if threshold is not None:
+        if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0 < threshold <= 1:
+            return jsonify({'success': False, 'error': 'Threshold must be a number in (0, 1]'}), 400
+        threshold = float(threshold)
+    report = llm.dedupe_forgetting_set(threshold)
+    return jsonify({'success': True, 'report': report})
+
+# Sync the forgetting set with files added, edited or deleted in the uploads folder
+def sync_uploaded_file(filename):
+    """Load a file from the uploads folder, returning False if it failed"""
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        loaded = llm.load_file(filepath)
+    except Exception as e:
+        print(f"Error loading existing file {filename}: {e}")
+        return False
+    if loaded:
+        print(f"Synced file: {filename}")
+    return loaded
+
+def forget_removed_file(filename):
+    llm.remove_file(filename, delete_file=False)
+
+uploads_watcher = UploadsWatcher(
+    app.config['UPLOAD_FOLDER'],
+    on_added=sync_uploaded_file,
+    on_changed=sync_uploaded_file,
+    on_removed=forget_removed_file,
+    interval=UPLOADS_SCAN_INTERVAL
+)
+
+# Load existing files on startup, then keep watching for changes
+uploads_watcher.scan()
+uploads_watcher.start()
 
 @app.route('/get-config', methods=['GET'])
+@profiled
 def get_config():
     return jsonify({
         'retain_mode': llm.config.retain_mode,
         'check_before_llm': llm.config.check_before_llm,
         'similarity_threshold': llm.config.similarity_threshold,
         'model_name': llm.config.model_name,
-        'use_entities': llm.config.use_entities
+        'use_entities': llm.config.use_entities,
+        'retain_block_threshold': llm.config.retain_block_threshold,
+        'retain_focus_threshold': llm.config.retain_focus_threshold,
+        'profile_requests': llm.config.profile_requests
     })
 
+@app.route('/evaluate', methods=['POST'])
+@profiled
+def start_evaluation():
+    data = request.json or {}
+    items = data.get('items')
+    if not items:
+        return jsonify({'success': False, 'error': 'No items provided'}), 400
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({'success': False, 'error': 'items must be a list of prompt records'}), 400
+    try:
+        modes = parse_modes(data.get('modes'))
+        for item in items:
+            validate_tenant_id(item.get('tenant_id'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    parallelism = data.get('parallelism', 4)
+    if isinstance(parallelism, bool) or not isinstance(parallelism, int) or not 1 <= parallelism <= MAX_EVAL_PARALLELISM:
+        return jsonify({
+            'success': False,
+            'error': f'parallelism must be an integer from 1 to {MAX_EVAL_PARALLELISM}'
+        }), 400
+    for i, item in enumerate(items):
+        item.setdefault('id', i)
+
+    checkpoint_path = None
+    if data.get('checkpoint'):
+        os.makedirs(EVAL_CHECKPOINT_FOLDER, exist_ok=True)
+        checkpoint_path = os.path.join(EVAL_CHECKPOINT_FOLDER, secure_filename(data['checkpoint']))
+
+    # Replays share generation slots with chat traffic but get a smaller share of the queue
+    evaluator = Evaluator(
+        llm,
+        parallelism=parallelism,
+        checkpoint_path=checkpoint_path,
+        max_queue=llm.config.max_background_queue
+    )
+    job_id = uuid.uuid4().hex
+    job = {'status': 'running', 'evaluator': evaluator, 'report': None, 'error': None, 'finished': None}
+    with eval_jobs_lock:
+        eval_jobs[job_id] = job
+
+    def run_job():
+        try:
+            job['report'] = evaluator.run(items, modes)
+            job['status'] = 'done'
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'failed'
+        job['finished'] = time.time()
+        prune_eval_jobs()
+
+    threading.Thread(target=run_job, daemon=True).start()
+    return jsonify({'success': True, 'job_id': job_id})
+
+def prune_eval_jobs():
+    """Forget all but the MAX_FINISHED_EVAL_JOBS most recently finished jobs"""
+    with eval_jobs_lock:
+        finished = sorted(
+            (job['finished'], job_id) for job_id, job in eval_jobs.items() if job['finished'] is not None
+        )
+        for _, job_id in finished[:-MAX_FINISHED_EVAL_JOBS]:
+            del eval_jobs[job_id]
+
+@app.route('/evaluate/<job_id>')
+@profiled
+def get_evaluation(job_id):
+    job = eval_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({
+        'success': True,
+        'status': job['status'],
+        'progress': job['evaluator'].progress(),
+        'report': job['report'],
+        'error': job['error']
+    })
+
+@app.route('/scheduler-stats')
+@profiled
+def get_scheduler_stats():
+    return jsonify(llm.scheduler.stats())
+
+@app.route('/backend-stats')
+@profiled
+def get_backend_stats():
+    if llm.backend_pool is None:
+        return jsonify({'backends': []})
+    return jsonify({'backends': llm.backend_pool.stats()})
+
+@app.route('/tenants')
+@profiled
+def get_tenants():
+    return jsonify(llm.tenants.stats())
+
+@app.route('/profiles')
+def get_profiles():
+    return jsonify({'profiles': list_profiles(PROFILE_FOLDER), 'capturing': profile_window['name']})
+
+@app.route('/profiles/<path:name>')
+def get_profile(name):
+    return send_from_directory(os.path.abspath(PROFILE_FOLDER), secure_filename(name))
+
+@app.route('/profiles/capture', methods=['POST'])
+def capture_profile():
+    """Sample every thread for a time window and save the result as one profile"""
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 10))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid seconds'}), 400
+    if not 0 < seconds <= 600:
+        return jsonify({'success': False, 'error': 'seconds must be between 0 and 600'}), 400
+    fmt = data.get('format', llm.config.profile_format)
+    if fmt not in PROFILE_FORMATS:
+        return jsonify({'success': False, 'error': f'Unknown profile format: {fmt}'}), 400
+
+    with profile_window_lock:
+        if profile_window['name'] is not None:
+            return jsonify({'success': False, 'error': 'A capture is already running'}), 409
+        name = profile_name('window')
+        profile_window['name'] = name
+
+    def run_capture():
+        profiler = SamplingProfiler(interval=llm.config.profile_interval_ms / 1000).start()
+        time.sleep(seconds)
+        save_profile(profiler.stop(), name, fmt)
+        with profile_window_lock:
+            profile_window['name'] = None
+
+    threading.Thread(target=run_capture, daemon=True).start()
+    return jsonify({'success': True, 'name': profile_filename(name, fmt), 'seconds': seconds})
+
 @app.route('/get-entities')
+@profiled
 def get_entities():
     return jsonify(load_entities())
 
 @app.route('/add-entity', methods=['POST'])
+@profiled
 def add_entity():
     data = request.json
     entity = data.get('entity')
@@ -251,6 +547,7 @@ def add_entity():
     return jsonify({'success': True})
 
 @app.route('/delete-entity/<int:index>', methods=['DELETE'])
+@profiled
 def delete_entity(index):
     entities = load_entities()
     if 0 <= index < len(entities['entities']):
@@ -0,0 +1,150 @@
+import threading
+import requests
+
+
+class BackendUnavailable(Exception):
+    """Raised when no healthy backend could serve a generation"""
+
+
+class BackendRequestError(Exception):
+    """Raised when a backend answered but the generation itself failed"""
+
+
+class Backend:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.served = 0
+        self.prefill_ns = 0      # total prompt_eval_duration reported by the backend
+        self.prefill_tokens = 0  # total prompt_eval_count reported by the backend
+
+
+class BackendPool:
+    """Spread generation across several Ollama HTTP endpoints.
+
+    Each request goes to the healthy backend with the fewest outstanding
+    requests. A backend that can't be reached or answers with a 5xx is
+    ejected and the request is retried on another one; a background checker
+    probes every backend and brings ejected ones back once they answer again.
+    Client errors (4xx, e.g. an unknown model) and read timeouts say nothing
+    about the backend's health, so they fail the request without ejecting.
+    """
+
+    def __init__(self, urls, timeout=120, health_interval=10.0):
+        self.backends = [Backend(url) for url in urls]
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self.next_start = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _pick(self, tried):
+        with self.lock:
+            candidates = [b for b in self.backends if b.healthy and b not in tried]
+            if not candidates:
+                return None
+            # Rotate the start so ties don't always land on the first backend
+            start = self.next_start % len(candidates)
+            self.next_start += 1
+            rotated = candidates[start:] + candidates[:start]
+            backend = min(rotated, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def generate(self, prompt, model_name):
+        """Generate a completion, retrying on other backends if one fails"""
+        tried = []
+        errors = []
+        while True:
+            backend = self._pick(tried)
+            if backend is None:
+                raise BackendUnavailable(
+                    "No healthy LLM backend available" + (f": {'; '.join(errors)}" if errors else "")
+                )
+            tried.append(backend)
+            try:
+                try:
+                    response = requests.post(
+                        f"{backend.url}/api/generate",
+                        json={'model': model_name, 'prompt': prompt, 'stream': False},
+                        timeout=self.timeout
+                    )
+                except requests.ConnectionError as e:
+                    errors.append(f"{backend.url}: {e}")
+                    self._eject(backend, e)
+                    continue
+                except requests.Timeout as e:
+                    raise BackendRequestError(f"{backend.url} timed out after {self.timeout}s") from e
+
+                if response.status_code >= 500:
+                    error = f"HTTP {response.status_code}: {response.text[:200]}"
+                    errors.append(f"{backend.url}: {error}")
+                    self._eject(backend, error)
+                    continue
+                if response.status_code >= 400:
+                    raise BackendRequestError(
+                        f"{backend.url} rejected the request with HTTP {response.status_code}: {response.text[:200]}"
+                    )
+                try:
+                    data = response.json()
+                except ValueError as e:
+                    raise BackendRequestError(f"{backend.url} returned invalid JSON") from e
+                with self.lock:
+                    backend.failures = 0
+                    backend.served += 1
+                    backend.prefill_ns += data.get('prompt_eval_duration', 0)
+                    backend.prefill_tokens += data.get('prompt_eval_count', 0)
+                return data.get('response', '')
+            finally:
+                with self.lock:
+                    backend.outstanding -= 1
+
+    def _eject(self, backend, error):
+        with self.lock:
+            backend.healthy = False
+            backend.failures += 1
+        print(f"Ejected LLM backend {backend.url}: {error}")
+
+    def check_health(self):
+        """Probe every backend once and update its health"""
+        for backend in self.backends:
+            try:
+                requests.get(f"{backend.url}/api/tags", timeout=5).raise_for_status()
+                healthy = True
+            except Exception:
+                healthy = False
+            with self.lock:
+                if healthy and not backend.healthy:
+                    print(f"LLM backend {backend.url} is healthy again")
+                backend.healthy = healthy
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.health_interval):
+            self.check_health()
+
+    def stats(self):
+        with self.lock:
+            return [
+                {
+                    'url': b.url,
+                    'healthy': b.healthy,
+                    'outstanding': b.outstanding,
+                    'failures': b.failures,
+                    'served': b.served,
+                    'avg_prefill_ms': b.prefill_ns / b.served / 1e6 if b.served else 0.0,
+                    'avg_prefill_tokens': b.prefill_tokens / b.served if b.served else 0.0
+                }
+                for b in self.backends
+            ]
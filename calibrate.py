@@ -0,0 +1,201 @@
+import argparse
+import json
+import torch
+
+from aliases import mentions, padded
+from evaluate import load_prompts
+
+# Candidate thresholds swept for every setting
+THRESHOLDS = torch.round(torch.arange(0.50, 1.0, 0.01) * 100) / 100
+
+# Retain mode blocks on moderate similarity only when most sentences are about the entity
+RETAIN_FOCUS_RATIO = 0.5
+
+
+def sensitivity_scores(llm, texts):
+    """Score texts like is_sensitive_query: -inf where it can never block, 1.0 for verbatim leaks"""
+    index = llm.forgetting_index
+    if not texts or not len(index):
+        return torch.full((len(texts),), float('-inf'))
+    scores = index.max_similarities(llm.get_embeddings(texts))
+    gated = torch.tensor([llm.mentions_forgotten_entity(text) for text in texts])
+    verbatim = torch.tensor([bool(index.verbatim_spans(text)) for text in texts])
+    scores = scores.masked_fill(~gated, float('-inf'))
+    return scores.masked_fill(verbatim, 1.0)
+
+
+def entity_focus_ratio(llm, text):
+    """Share of sentences mentioning a forgotten entity, as generate_response computes it"""
+    sentences = [padded(sentence) for sentence in text.split('.')]
+    entity_sentences = sum(
+        1 for aliases in llm.entity_aliases.values() for sentence in sentences
+        if mentions(sentence, aliases)
+    )
+    return entity_sentences / len(sentences)
+
+
+def pr_curve(predicted, labels):
+    """Precision, recall and F1 for every threshold column of a boolean prediction tensor"""
+    labels = labels.view(-1, *([1] * (predicted.dim() - 1)))
+    tp = (predicted & labels).sum(dim=0).float()
+    fp = (predicted & ~labels).sum(dim=0).float()
+    fn = (~predicted & labels).sum(dim=0).float()
+    precision = torch.where(tp + fp > 0, tp / (tp + fp), torch.ones_like(tp))
+    recall = torch.where(tp + fn > 0, tp / (tp + fn), torch.ones_like(tp))
+    f1 = torch.where(precision + recall > 0, 2 * precision * recall / (precision + recall), torch.zeros_like(tp))
+    return precision, recall, f1
+
+
+def best_index(f1):
+    """Flat index of the highest F1, preferring the strictest thresholds on ties"""
+    flat = f1.flatten()
+    candidates = (flat >= flat.max() - 1e-9).nonzero(as_tuple=True)[0]
+    return candidates[-1].item()
+
+
+def curve_points(thresholds, precision, recall, f1):
+    return [
+        {'threshold': round(t, 2), 'precision': p, 'recall': r, 'f1': f}
+        for t, p, r, f in zip(thresholds.tolist(), precision.tolist(), recall.tolist(), f1.tolist())
+    ]
+
+
+def calibrate_single(scores, labels, current):
+    """Sweep one block threshold over precomputed scores"""
+    predicted = scores.unsqueeze(1) > THRESHOLDS.unsqueeze(0)
+    precision, recall, f1 = pr_curve(predicted, labels)
+    best = best_index(f1)
+    current_p, current_r, current_f1 = pr_curve((scores > current).unsqueeze(1), labels)
+    return {
+        'recommended': round(THRESHOLDS[best].item(), 2),
+        'precision': precision[best].item(),
+        'recall': recall[best].item(),
+        'f1': f1[best].item(),
+        'current': {
+            'threshold': current,
+            'precision': current_p.item(),
+            'recall': current_r.item(),
+            'f1': current_f1.item()
+        },
+        'curve': curve_points(THRESHOLDS, precision, recall, f1)
+    }
+
+
+def calibrate_retain(scores, focus, labels, current_block, current_focus):
+    """Sweep retain mode's block and focus thresholds jointly"""
+    block = scores.view(-1, 1, 1) > THRESHOLDS.view(1, -1, 1)
+    moderate = scores.view(-1, 1, 1) > THRESHOLDS.view(1, 1, -1)
+    focused = (focus > RETAIN_FOCUS_RATIO).view(-1, 1, 1)
+    predicted = block | (moderate & focused)
+    precision, recall, f1 = pr_curve(predicted, labels)
+    best = best_index(f1)
+    bi, fi = divmod(best, len(THRESHOLDS))
+
+    current = (scores > current_block) | ((scores > current_focus) & (focus > RETAIN_FOCUS_RATIO))
+    current_p, current_r, current_f1 = pr_curve(current.unsqueeze(1), labels)
+    return {
+        'recommended': {
+            'retain_block_threshold': round(THRESHOLDS[bi].item(), 2),
+            'retain_focus_threshold': round(THRESHOLDS[fi].item(), 2)
+        },
+        'precision': precision[bi, fi].item(),
+        'recall': recall[bi, fi].item(),
+        'f1': f1[bi, fi].item(),
+        'current': {
+            'retain_block_threshold': current_block,
+            'retain_focus_threshold': current_focus,
+            'precision': current_p.item(),
+            'recall': current_r.item(),
+            'f1': current_f1.item()
+        },
+        # Block-threshold curve at the recommended focus threshold
+        'curve': curve_points(THRESHOLDS, precision[:, fi], recall[:, fi], f1[:, fi])
+    }
+
+
+def calibrate(llm, records):
+    """Recommend thresholds per mode from labeled prompts and responses.
+
+    Each text is embedded once and scored against the forgetting set in one
+    batched matrix product; every candidate threshold is then evaluated at
+    once by broadcasting, so no threshold trial re-embeds anything. Prompts
+    generate_response blocks on keywords alone never reach a threshold, so
+    they and their responses are left out of the sweep.
+    """
+    labeled, hard_blocked = [], 0
+    for r in records:
+        if r.get('expected') not in ('block', 'allow'):
+            continue
+        if r.get('prompt') and llm.is_direct_entity_question(r['prompt']):
+            hard_blocked += 1
+        else:
+            labeled.append(r)
+    report = {'labeled': len(labeled), 'hard_blocked': hard_blocked, 'modes': {}}
+
+    prompts = [r for r in labeled if r.get('prompt')]
+    if prompts:
+        scores = sensitivity_scores(llm, [r['prompt'] for r in prompts])
+        labels = torch.tensor([r['expected'] == 'block' for r in prompts])
+        report['modes']['check_before_llm'] = {
+            'setting': 'similarity_threshold',
+            'count': len(prompts),
+            **calibrate_single(scores, labels, llm.config.similarity_threshold)
+        }
+
+    responses = [r for r in labeled if r.get('response')]
+    if responses:
+        texts = [r['response'] for r in responses]
+        scores = sensitivity_scores(llm, texts)
+        labels = torch.tensor([r['expected'] == 'block' for r in responses])
+        report['modes']['forget'] = {
+            'setting': 'similarity_threshold',
+            'count': len(responses),
+            **calibrate_single(scores, labels, llm.config.similarity_threshold)
+        }
+        focus = torch.tensor([entity_focus_ratio(llm, text) for text in texts])
+        report['modes']['retain'] = {
+            'count': len(responses),
+            **calibrate_retain(scores, focus, labels,
+                               llm.config.retain_block_threshold, llm.config.retain_focus_threshold)
+        }
+    return report
+
+
+def apply_recommendations(llm, report):
+    """Write recommended thresholds for the currently configured mode into config.json"""
+    modes = report['modes']
+    threshold_mode = 'check_before_llm' if llm.config.check_before_llm else 'forget'
+    updates = {}
+    if threshold_mode in modes:
+        updates['similarity_threshold'] = modes[threshold_mode]['recommended']
+    if 'retain' in modes:
+        updates.update(modes['retain']['recommended'])
+    if updates:
+        llm.config.update_config(**updates)
+    return updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate similarity thresholds from labeled prompts and responses")
+    parser.add_argument('labeled', help="JSONL with prompt, optional response and expected block/allow per line")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--apply', action='store_true', help="Save the recommended thresholds to config.json")
+    args = parser.parse_args()
+
+    from model import ForgettingLLM
+    llm = ForgettingLLM()
+    llm.load_folder('uploads')
+
+    report = calibrate(llm, load_prompts(args.labeled))
+    if args.apply:
+        report['applied'] = apply_recommendations(llm, report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
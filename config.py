@@ -11,8 +11,23 @@ class ModelConfig:
             "retain_mode": False,
             "check_before_llm": False,
             "similarity_threshold": 0.85,
+            "retain_block_threshold": 0.9,
+            "retain_focus_threshold": 0.7,
             "model_name": "llama3.2:latest",
-            "use_entities": False
+            "use_entities": False,
+            "embedding_dtype": "float16",
+            "tenant_memory_budget_mb": 1024,
+            "max_concurrent_generations": 2,
+            "max_generation_queue": 16,
+            "generation_queue_timeout": 30.0,
+            "max_background_queue": 4,
+            "ollama_endpoints": [],
+            "backend_health_interval": 10.0,
+            "dedupe_threshold": 0.95,
+            "profile_requests": False,
+            "profile_interval_ms": 5,
+            "profile_format": "collapsed",
+            "max_saved_profiles": 100
         }
 
         try:
@@ -22,7 +37,7 @@ class ModelConfig:
                     # Only update values that exist in saved config
                     for key in default_config:
                         if key in saved_config:
-                            if key == "similarity_threshold":
+                            if key in ("similarity_threshold", "retain_block_threshold", "retain_focus_threshold"):
                                 # Ensure threshold is float with 2 decimal places
                                 default_config[key] = round(float(saved_config[key]), 2)
                             else:
@@ -35,8 +50,23 @@ class ModelConfig:
         self.retain_mode = default_config["retain_mode"]
         self.check_before_llm = default_config["check_before_llm"]
         self.similarity_threshold = default_config["similarity_threshold"]
+        self.retain_block_threshold = default_config["retain_block_threshold"]
+        self.retain_focus_threshold = default_config["retain_focus_threshold"]
         self.model_name = default_config["model_name"]
         self.use_entities = default_config["use_entities"]
+        self.embedding_dtype = default_config["embedding_dtype"]
+        self.tenant_memory_budget_mb = default_config["tenant_memory_budget_mb"]
+        self.max_concurrent_generations = default_config["max_concurrent_generations"]
+        self.max_generation_queue = default_config["max_generation_queue"]
+        self.generation_queue_timeout = default_config["generation_queue_timeout"]
+        self.max_background_queue = default_config["max_background_queue"]
+        self.ollama_endpoints = default_config["ollama_endpoints"]
+        self.backend_health_interval = default_config["backend_health_interval"]
+        self.dedupe_threshold = default_config["dedupe_threshold"]
+        self.profile_requests = default_config["profile_requests"]
+        self.profile_interval_ms = default_config["profile_interval_ms"]
+        self.profile_format = default_config["profile_format"]
+        self.max_saved_profiles = default_config["max_saved_profiles"]
 
     def save_config(self):
         """Save current configuration to file"""
@@ -44,8 +74,23 @@ class ModelConfig:
             "retain_mode": self.retain_mode,
             "check_before_llm": self.check_before_llm,
             "similarity_threshold": float(self.similarity_threshold),
+            "retain_block_threshold": float(self.retain_block_threshold),
+            "retain_focus_threshold": float(self.retain_focus_threshold),
             "model_name": self.model_name,
-            "use_entities": self.use_entities
+            "use_entities": self.use_entities,
+            "embedding_dtype": self.embedding_dtype,
+            "tenant_memory_budget_mb": self.tenant_memory_budget_mb,
+            "max_concurrent_generations": self.max_concurrent_generations,
+            "max_generation_queue": self.max_generation_queue,
+            "generation_queue_timeout": self.generation_queue_timeout,
+            "max_background_queue": self.max_background_queue,
+            "ollama_endpoints": self.ollama_endpoints,
+            "backend_health_interval": self.backend_health_interval,
+            "dedupe_threshold": self.dedupe_threshold,
+            "profile_requests": self.profile_requests,
+            "profile_interval_ms": self.profile_interval_ms,
+            "profile_format": self.profile_format,
+            "max_saved_profiles": self.max_saved_profiles
         }
         try:
             with open(self.config_file, 'w') as f:
@@ -57,7 +102,9 @@ class ModelConfig:
             raise Exception(f"Failed to save configuration: {str(e)}")
 
     def update_config(self, retain_mode=None, check_before_llm=None, 
-                     similarity_threshold=None, model_name=None, use_entities=None):
+                     similarity_threshold=None, model_name=None, use_entities=None,
+                     retain_block_threshold=None, retain_focus_threshold=None,
+                     profile_requests=None):
         """Update configuration settings"""
         changed = False
         
@@ -76,6 +123,15 @@ class ModelConfig:
         if use_entities is not None:
             self.use_entities = use_entities
             changed = True
+        if retain_block_threshold is not None:
+            self.retain_block_threshold = retain_block_threshold
+            changed = True
+        if retain_focus_threshold is not None:
+            self.retain_focus_threshold = retain_focus_threshold
+            changed = True
+        if profile_requests is not None:
+            self.profile_requests = profile_requests
+            changed = True
         
         # Save changes to file if any changes were made
         if changed:
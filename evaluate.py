@@ -0,0 +1,268 @@
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from scheduler import SchedulerBusy
+from stage_timing import collect_stage_times
+from tenants import validate_tenant_id
+
+MODE_SETTINGS = ('retain_mode', 'check_before_llm', 'use_entities')
+
+# Responses starting with these are the model's refusal messages
+BLOCK_PREFIXES = (
+    "I apologize, but I cannot provide",
+    "I'm sorry, I cannot provide"
+)
+
+ERROR_PREFIXES = (
+    "Error:",
+    "I apologize, but I encountered an error",
+    "I apologize, but I couldn't generate"
+)
+
+
+def all_modes():
+    """Every combination of the three mode switches"""
+    return [dict(zip(MODE_SETTINGS, values)) for values in itertools.product([False, True], repeat=3)]
+
+
+def mode_key(mode):
+    return ",".join(f"{name}={int(bool(mode.get(name)))}" for name in MODE_SETTINGS)
+
+
+def load_prompts(path):
+    """Read a JSONL prompt log, keeping each record's line number as its id"""
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            record.setdefault('id', line_no)
+            items.append(record)
+    return items
+
+
+def classify(response):
+    if response is None or response.startswith(ERROR_PREFIXES):
+        return 'error'
+    if response.startswith(BLOCK_PREFIXES):
+        return 'block'
+    return 'allow'
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Evaluator:
+    """Replay logged prompts through generate_response in every requested mode.
+
+    Records may carry `prompt` (or `message`), an optional `expected` label of
+    "block" or "allow", `chat_history` and `tenant_id`. Finished results are
+    appended to `checkpoint_path` so an interrupted run resumes where it left
+    off. Replays queue for generation slots like normal chat traffic, but
+    only while fewer than `max_queue` generations are waiting, and retry when
+    shed, so a long run cannot crowd chats out of the queue.
+    """
+
+    def __init__(self, llm, parallelism=4, checkpoint_path=None, max_queue=None):
+        self.llm = llm
+        self.parallelism = parallelism
+        self.checkpoint_path = checkpoint_path
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.done = 0
+        self.total = 0
+
+    def load_checkpoint(self):
+        results = {}
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        result = json.loads(line)
+                        results[(result['mode'], str(result['id']))] = result
+        return results
+
+    def _generate(self, record):
+        message = record.get('prompt', record.get('message', ''))
+        while True:
+            try:
+                with self.llm.admission('evaluation', max_queue=self.max_queue):
+                    return self.llm.generate_response(message, record.get('chat_history'))
+            except SchedulerBusy as e:
+                time.sleep(e.retry_after)
+
+    def _run_one(self, record, mode):
+        start = time.perf_counter()
+        try:
+            with self.llm.use_tenant(validate_tenant_id(record.get('tenant_id'))):
+                with self.llm.use_config(**mode):
+                    with collect_stage_times() as stages:
+                        response = self._generate(record)
+            outcome = classify(response)
+        except Exception as e:
+            response, outcome, stages = f"Error: {e}", 'error', {}
+        return {
+            'id': record['id'],
+            'mode': mode_key(mode),
+            'outcome': outcome,
+            'expected': record.get('expected'),
+            'latency': time.perf_counter() - start,
+            'stages': stages,
+            'response': response
+        }
+
+    def _record(self, result, checkpoint):
+        with self.lock:
+            self.done += 1
+            if checkpoint is not None:
+                checkpoint.write(json.dumps(result) + "\n")
+                checkpoint.flush()
+
+    def run(self, items, modes=None):
+        """Evaluate items in each mode and return the aggregated report"""
+        modes = modes or all_modes()
+        results = self.load_checkpoint()
+        pending = [
+            (record, mode) for mode in modes for record in items
+            if (mode_key(mode), str(record['id'])) not in results
+        ]
+        self.total = len(items) * len(modes)
+        self.done = self.total - len(pending)
+        if pending:
+            print(f"Evaluating {len(pending)} prompt/mode pairs ({self.done} restored from checkpoint)")
+
+        checkpoint = open(self.checkpoint_path, 'a', encoding='utf-8') if self.checkpoint_path else None
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+                futures = [pool.submit(self._run_one, record, mode) for record, mode in pending]
+                # Checkpoint each result as soon as it lands, not in submission order
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[(result['mode'], str(result['id']))] = result
+                    self._record(result, checkpoint)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+        elapsed = time.perf_counter() - started
+
+        ids = {str(record['id']) for record in items}
+        report = {'modes': {}, 'elapsed': elapsed, 'evaluated': len(pending)}
+        for mode in modes:
+            key = mode_key(mode)
+            mode_results = [r for (m, i), r in results.items() if m == key and i in ids]
+            report['modes'][key] = summarize(mode_results, elapsed if pending else 0.0)
+        return report
+
+    def progress(self):
+        with self.lock:
+            return {'done': self.done, 'total': self.total}
+
+
+def summarize(results, elapsed):
+    """Block rate, label accuracy and latency figures for one mode"""
+    count = len(results)
+    blocked = sum(1 for r in results if r['outcome'] == 'block')
+    errors = sum(1 for r in results if r['outcome'] == 'error')
+    labeled = [r for r in results if r.get('expected') in ('block', 'allow') and r['outcome'] != 'error']
+    correct = sum(1 for r in labeled if r['outcome'] == r['expected'])
+    true_blocks = sum(1 for r in labeled if r['outcome'] == 'block' and r['expected'] == 'block')
+    predicted_blocks = sum(1 for r in labeled if r['outcome'] == 'block')
+    expected_blocks = sum(1 for r in labeled if r['expected'] == 'block')
+
+    latencies = [r['latency'] for r in results]
+    stage_names = sorted({name for r in results for name in r.get('stages', {})})
+    stages = {}
+    for name in stage_names:
+        values = [r['stages'].get(name, 0.0) for r in results]
+        stages[name] = {
+            'mean': sum(values) / count,
+            'p50': percentile(values, 0.5),
+            'p95': percentile(values, 0.95)
+        }
+
+    return {
+        'count': count,
+        'blocked': blocked,
+        'errors': errors,
+        'block_rate': blocked / count if count else 0.0,
+        'labeled': len(labeled),
+        'accuracy': correct / len(labeled) if labeled else None,
+        'block_precision': true_blocks / predicted_blocks if predicted_blocks else None,
+        'block_recall': true_blocks / expected_blocks if expected_blocks else None,
+        'latency': {
+            'mean': sum(latencies) / count if count else 0.0,
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95)
+        },
+        'stages': stages,
+        'throughput': count / elapsed if elapsed else None
+    }
+
+
+def parse_modes(spec):
+    """'all', a semicolon list like 'retain_mode=1,check_before_llm=0,use_entities=0', or a list of mode dicts"""
+    if not spec or spec == 'all':
+        return all_modes()
+    if isinstance(spec, list):
+        modes = []
+        for mode in spec:
+            if not isinstance(mode, dict):
+                raise ValueError(f"Invalid mode: {mode!r}")
+            # Modes become config overrides, so nothing but the mode switches may be set
+            unknown = sorted(set(mode) - set(MODE_SETTINGS))
+            if unknown:
+                raise ValueError(f"Unknown mode setting: {', '.join(map(str, unknown))}")
+            modes.append({name: bool(mode.get(name)) for name in MODE_SETTINGS})
+        return modes
+    if not isinstance(spec, str):
+        raise ValueError(f"Invalid modes: {spec!r}")
+    modes = []
+    for part in spec.split(';'):
+        mode = {name: False for name in MODE_SETTINGS}
+        for setting in part.split(','):
+            name, _, value = setting.partition('=')
+            if name.strip() not in MODE_SETTINGS:
+                raise ValueError(f"Unknown mode setting: {name}")
+            mode[name.strip()] = value.strip().lower() in ('1', 'true', 'yes')
+        modes.append(mode)
+    return modes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a JSONL prompt log through the forgetting pipeline")
+    parser.add_argument('prompts', help="JSONL file with one {\"prompt\", \"expected\"} record per line")
+    parser.add_argument('--parallelism', type=int, default=4)
+    parser.add_argument('--modes', default='all', help="'all' or e.g. 'retain_mode=1,check_before_llm=0;use_entities=1'")
+    parser.add_argument('--checkpoint', help="JSONL file to resume from and append results to")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    from model import ForgettingLLM
+    llm = ForgettingLLM()
+    llm.load_folder('uploads')
+
+    evaluator = Evaluator(llm, parallelism=args.parallelism, checkpoint_path=args.checkpoint)
+    report = evaluator.run(load_prompts(args.prompts), parse_modes(args.modes))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
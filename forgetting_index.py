@@ -0,0 +1,517 @@
+import itertools
+import sys
+import threading
+import time
+import torch
+import torch.nn.functional as F
+from shingle_index import DICT_ENTRY_BYTES, ShingleIndex
+
+# Rows scored per matmul, bounds the float32 scratch space for float16/int8 stores
+SEARCH_CHUNK_ROWS = 65536
+
+# Rows clustered per matmul during a dedupe pass
+DEDUPE_BLOCK_ROWS = 1024
+
+# Heap per distinct statement besides its text: rows (or merged) and refcounts
+# entries, its statements slot and row number
+STATEMENT_OVERHEAD_BYTES = 2 * DICT_ENTRY_BYTES + 8 + 28
+
+
+class ForgettingIndex:
+    """Forgetting statements stored as per-file segments over one shared embedding matrix.
+
+    Every distinct statement owns a single row and a reference count of the
+    segments (uploaded files) that contain it. Removing a segment only touches
+    its own statements: rows whose count drops to zero are tombstoned, and the
+    matrix is compacted in the background once enough tombstones pile up.
+
+    Rows are stored L2-normalised as float32, float16 or per-row scaled int8,
+    and statement text is interned so each statement is held exactly once.
+    Live statements are also shingled for verbatim leak detection.
+
+    An optional dedupe pass clusters near-duplicate rows and keeps only one
+    representative row per cluster; the other statements give up their rows
+    and are scanned through the representative's. When a representative's
+    file is deleted, one of its members takes over the row at once and is
+    re-embedded in the background.
+    """
+
+    def __init__(self, embed_fn, dtype='float16', compact_ratio=0.25, ngram=8):
+        if dtype not in ('float32', 'float16', 'int8'):
+            raise ValueError(f"Unsupported embedding dtype: {dtype}")
+        self.embed_fn = embed_fn
+        self.dtype = dtype
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self.segments = {}      # segment id -> statements contributed by that file
+        self.refcounts = {}     # statement -> number of live segments holding it
+        self.rows = {}          # statement -> row in self.embeddings (live or tombstoned)
+        self.statements = []    # row -> statement
+        self.embeddings = None  # (rows, dim) tensor of unit vectors in self.dtype
+        self.scales = None      # (rows,) dequantisation scales, int8 only
+        self.live = torch.zeros(0, dtype=torch.bool)
+        self.merged = {}        # merged statement -> representative row scanned in its place
+        self.members = {}       # representative row -> set of statements merged into it
+        self.stale = set()      # promoted statements still holding their old representative's vector
+        self.tombstones = 0
+        self.next_segment_id = 0
+        self.version = 0        # bumped on every segment change
+        self.layout = 0         # bumped whenever rows are renumbered or rewritten
+        self.compacting = False
+        self.refreshing = False
+        self.shingles = ShingleIndex(ngram=ngram)
+        self.heap_bytes = 0     # statement bookkeeping, adjusted as statements come and go
+        self.nbytes = 0         # total resident estimate, refreshed after every change
+
+    def __len__(self):
+        return len(self.statements) - self.tombstones + len(self.merged)
+
+    def embed_missing(self, statements, embedded=None):
+        """Embed, without holding the lock, statements that have no row yet.
+
+        Returns a statement -> embedding dict to pass to add_segment or
+        replace_segment, which then only need the lock to append rows.
+        """
+        embedded = {} if embedded is None else embedded
+        with self.lock:
+            missing = [stmt for stmt in dict.fromkeys(statements) if not self._holds(stmt) and stmt not in embedded]
+        if missing:
+            embedded.update(zip(missing, self.embed_fn(missing)))
+        return embedded
+
+    def _holds(self, stmt):
+        """Whether stmt has a row (live or tombstoned) or is merged into another's"""
+        return stmt in self.rows or stmt in self.merged
+
+    def add_segment(self, statements, embedded=None):
+        """Register a file's statements and return its segment id"""
+        return self._add_segment(statements, embedded, replaces=None)
+
+    def replace_segment(self, segment_id, statements, embedded=None):
+        """Swap a segment's statements, embedding only lines that are new to the index"""
+        return self._add_segment(statements, embedded, replaces=segment_id)
+
+    def _add_segment(self, statements, embedded, replaces):
+        statements = [sys.intern(stmt) for stmt in dict.fromkeys(statements)]
+        embedded = {} if embedded is None else embedded
+        while True:
+            self.embed_missing(statements, embedded)
+            with self.lock:
+                # A compaction may have dropped tombstoned rows since they were checked
+                if any(not self._holds(stmt) and stmt not in embedded for stmt in statements):
+                    continue
+                new_statements = []
+                for stmt in statements:
+                    count = self.refcounts.get(stmt, 0)
+                    self.refcounts[stmt] = count + 1
+                    if count > 0:
+                        continue
+                    row = self.rows.get(stmt)
+                    if row is not None:
+                        # Statement was tombstoned but not compacted yet, revive its row
+                        self.live[row] = True
+                        self.tombstones -= 1
+                        self.shingles.add(stmt)
+                    else:
+                        new_statements.append(stmt)
+
+                if new_statements:
+                    self._append_rows(new_statements, [embedded[stmt] for stmt in new_statements])
+
+                segment_id = self.next_segment_id
+                self.next_segment_id += 1
+                self.version += 1
+                self.segments[segment_id] = statements
+                self.heap_bytes += sys.getsizeof(statements)
+                if replaces is not None:
+                    self.remove_segment(replaces)
+                self._update_nbytes()
+                return segment_id
+
+    def _append_rows(self, statements, embeddings):
+        block, scales = self._encode(torch.stack(embeddings).float())
+        start = len(self.statements)
+        self.embeddings = block if self.embeddings is None else torch.cat([self.embeddings, block])
+        if scales is not None:
+            self.scales = scales if self.scales is None else torch.cat([self.scales, scales])
+        self.live = torch.cat([self.live, torch.ones(len(statements), dtype=torch.bool)])
+        for offset, stmt in enumerate(statements):
+            self.rows[stmt] = start + offset
+            self.statements.append(stmt)
+            self.shingles.add(stmt)
+            self.heap_bytes += statement_bytes(stmt)
+
+    def _encode(self, block):
+        unit = F.normalize(block, dim=1)
+        if self.dtype == 'int8':
+            scales = unit.abs().amax(dim=1).clamp_min(1e-12) / 127
+            return torch.round(unit / scales.unsqueeze(1)).to(torch.int8), scales
+        if self.dtype == 'float16':
+            return unit.half(), None
+        return unit, None
+
+    def remove_segment(self, segment_id):
+        """Drop a file's segment, tombstoning statements no other file still holds"""
+        with self.lock:
+            statements = self.segments.pop(segment_id, None)
+            if statements is None:
+                return 0
+            self.version += 1
+            self.heap_bytes -= sys.getsizeof(statements)
+
+            removed = 0
+            for stmt in statements:
+                count = self.refcounts.get(stmt, 0) - 1
+                if count > 0:
+                    self.refcounts[stmt] = count
+                    continue
+                self.refcounts.pop(stmt, None)
+                self.stale.discard(stmt)
+                if stmt in self.merged:
+                    representative = self.merged.pop(stmt)
+                    members = self.members[representative]
+                    members.discard(stmt)
+                    if not members:
+                        del self.members[representative]
+                    self.shingles.remove(stmt)
+                    self.heap_bytes -= statement_bytes(stmt)
+                    removed += 1
+                    continue
+                row = self.rows.get(stmt)
+                if row is not None and self.live[row]:
+                    if row in self.members:
+                        self._promote(row)
+                    else:
+                        self.live[row] = False
+                        self.tombstones += 1
+                    self.shingles.remove(stmt)
+                    removed += 1
+
+            if self.tombstones and self.tombstones >= self.compact_ratio * len(self.statements):
+                self.schedule_compaction()
+            self._update_nbytes()
+            return removed
+
+    def _promote(self, row):
+        """Hand a deleted representative's row to one of its members.
+
+        The member keeps scanning through the old vector, which is within the
+        dedupe threshold of it, until the background refresh re-embeds it.
+        """
+        members = self.members.pop(row)
+        promoted = min(members)
+        members.discard(promoted)
+        del self.merged[promoted]
+        del self.rows[self.statements[row]]
+        self.heap_bytes -= statement_bytes(self.statements[row])
+        self.statements[row] = promoted
+        self.rows[promoted] = row
+        if members:
+            self.members[row] = members
+        self.stale.add(promoted)
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        """Re-embed promoted statements on a background thread"""
+        with self.lock:
+            if self.refreshing or not self.stale:
+                return
+            self.refreshing = True
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self):
+        """Replace promoted statements' borrowed vectors with their own embeddings"""
+        try:
+            while True:
+                with self.lock:
+                    stale = list(self.stale)
+                    if not stale:
+                        self.refreshing = False
+                        return
+                embeddings = self.embed_fn(stale)
+                with self.lock:
+                    for stmt, embedding in zip(stale, embeddings):
+                        row = self.rows.get(stmt)
+                        if stmt not in self.stale or row is None:
+                            continue
+                        self.stale.discard(stmt)
+                        block, scales = self._encode(embedding.float().unsqueeze(0))
+                        self.embeddings[row] = block[0]
+                        if scales is not None:
+                            self.scales[row] = scales[0]
+                    # Rows were rewritten in place, a running dedupe must start over
+                    self.layout += 1
+        except Exception as e:
+            print(f"Error re-embedding promoted statements: {e}")
+            with self.lock:
+                self.refreshing = False
+
+    def schedule_compaction(self):
+        """Compact tombstoned rows on a background thread"""
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Rewrite the embedding matrix without tombstoned rows"""
+        try:
+            with self.lock:
+                if not self.tombstones:
+                    return
+                keep = self.live.nonzero(as_tuple=True)[0]
+                for row in (~self.live).nonzero(as_tuple=True)[0].tolist():
+                    # Merged rows' statements stay held, only their rows go
+                    if self.statements[row] not in self.merged:
+                        self.heap_bytes -= statement_bytes(self.statements[row])
+                new_row = {old: new for new, old in enumerate(keep.tolist())}
+                # Representatives are always live, a deleted one hands its row to a member
+                self.merged = {stmt: new_row[row] for stmt, row in self.merged.items()}
+                self.members = {new_row[row]: members for row, members in self.members.items()}
+                self.statements = [self.statements[i] for i in keep.tolist()]
+                self.embeddings = self.embeddings.index_select(0, keep) if len(keep) else None
+                if self.scales is not None:
+                    self.scales = self.scales.index_select(0, keep) if len(keep) else None
+                self.live = torch.ones(len(self.statements), dtype=torch.bool)
+                self.rows = {stmt: row for row, stmt in enumerate(self.statements)}
+                self.tombstones = 0
+                self.layout += 1
+                self._update_nbytes()
+        finally:
+            self.compacting = False
+
+    def max_similarity(self, embedding):
+        """Highest cosine similarity between embedding and any live statement"""
+        return self.max_similarities(embedding.unsqueeze(0))[0].item()
+
+    def max_similarities(self, embeddings):
+        """Best live-statement similarity for each row of a (n, dim) batch, in one pass"""
+        with self.lock:
+            if self.embeddings is None or len(self) == 0:
+                return torch.zeros(len(embeddings))
+            matrix_rows, scales, mask = self.embeddings, self.scales, self.live
+            queries = F.normalize(embeddings.float(), dim=1)
+            best = torch.full((len(queries),), float('-inf'))
+            for start in range(0, len(matrix_rows), SEARCH_CHUNK_ROWS):
+                end = start + SEARCH_CHUNK_ROWS
+                matrix = queries @ matrix_rows[start:end].float().T
+                if scales is not None:
+                    matrix = matrix * scales[start:end]
+                matrix = matrix.masked_fill(~mask[start:end], float('-inf'))
+                best = torch.maximum(best, matrix.max(dim=1).values)
+            return best
+
+    def dedupe(self, threshold=0.95, probes=64, block_threshold=None):
+        """Cluster near-duplicate live rows and drop all but one row per cluster.
+
+        Rows join the first representative they reach `threshold` cosine
+        similarity with (leader clustering, in row order). Merged statements
+        give up their rows, which are compacted out of the matrix, and are
+        scanned through their representative's. Clustering runs on a snapshot
+        of the store outside the lock, so similarity checks keep being served;
+        the result is applied under the lock, skipping rows deleted in the
+        meantime, and redone if the rows were renumbered or rewritten.
+
+        The loss is measured on up to `probes` live statements spread across
+        the store: the largest drop in their best similarity, and how many of
+        them fell from `block_threshold` or above to below it.
+        """
+        while True:
+            with self.lock:
+                layout = self.layout
+                candidates = self.live.nonzero(as_tuple=True)[0]
+                # Appends and compaction build new tensors, so these stay a consistent snapshot
+                embeddings, scales = self.embeddings, self.scales
+                scanned_before = len(candidates)
+                bytes_before = self.memory_bytes()
+            if not len(candidates):
+                return {'rows': 0, 'scanned_before': 0, 'scanned_after': 0}
+
+            picks = torch.linspace(0, len(candidates) - 1, min(probes, len(candidates))).round().long()
+            probe_queries = unit_rows(embeddings, scales, candidates[picks.unique()])
+            started = time.perf_counter()
+            probe_before = self.max_similarities(probe_queries)
+            scan_before = time.perf_counter() - started
+
+            clusters = cluster_rows(embeddings, scales, candidates, threshold)
+
+            with self.lock:
+                if self.layout != layout:
+                    continue
+                for representative, rows in clusters.items():
+                    rows = [row for row in rows if self.live[row]]
+                    if not self.live[representative]:
+                        # Its file was deleted during the pass, promote a member instead
+                        if not rows:
+                            continue
+                        representative = rows.pop(0)
+                    for row in rows:
+                        self._merge(row, representative)
+                self.compact()
+                scanned_after = int(self.live.sum())
+                bytes_after = self.memory_bytes()
+                rows = len(self)
+                merged = len(self.merged)
+            break
+
+        started = time.perf_counter()
+        probe_after = self.max_similarities(probe_queries)
+        scan_after = time.perf_counter() - started
+        report = {
+            'rows': rows,
+            'clusters': scanned_after,
+            'merged': merged,
+            'scanned_before': scanned_before,
+            'scanned_after': scanned_after,
+            'reduction': 1 - scanned_after / scanned_before if scanned_before else 0.0,
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+            'probes': len(probe_queries),
+            'max_similarity_loss': max(0.0, (probe_before - probe_after).max().item()),
+            'probe_scan_ms_before': scan_before * 1000,
+            'probe_scan_ms_after': scan_after * 1000
+        }
+        if block_threshold is not None:
+            report['block_threshold'] = block_threshold
+            report['probes_unblocked'] = int(((probe_before >= block_threshold) & (probe_after < block_threshold)).sum())
+        return report
+
+    def _merge(self, row, representative):
+        """Fold a live row, and anything merged into it, into representative's cluster"""
+        stmt = self.statements[row]
+        members = self.members.setdefault(representative, set())
+        for member in self.members.pop(row, ()):
+            self.merged[member] = representative
+            members.add(member)
+        self.merged[stmt] = representative
+        members.add(stmt)
+        del self.rows[stmt]
+        self.stale.discard(stmt)
+        # Left as a tombstone for compaction to drop
+        self.live[row] = False
+        self.tombstones += 1
+
+    def verbatim_spans(self, text):
+        """Spans of text copying live statements word for word"""
+        with self.lock:
+            return self.shingles.scan(text)
+
+    def _update_nbytes(self):
+        """Refresh nbytes from the tensor sizes and running heap counts; lock must be held"""
+        total = self.heap_bytes + self.shingles.memory_bytes()
+        for tensor in (self.embeddings, self.scales, self.live):
+            if tensor is not None:
+                total += tensor.element_size() * tensor.nelement()
+        self.nbytes = total
+
+    def memory_bytes(self):
+        """Bytes held by the embedding store plus the statement bookkeeping and shingle table.
+
+        Kept up to date by every change, so reading it never waits on the lock.
+        """
+        return self.nbytes
+
+    def state_dict(self):
+        """Compacted snapshot of the index for spilling to disk"""
+        with self.lock:
+            self.compact()
+            return {
+                'dtype': self.dtype,
+                'statements': list(self.statements),
+                'embeddings': self.embeddings,
+                'scales': self.scales,
+                'segments': dict(self.segments),
+                'next_segment_id': self.next_segment_id,
+                'merged': dict(self.merged),
+                'stale': list(self.stale)
+            }
+
+    def load_state_dict(self, state):
+        """Restore a snapshot produced by state_dict"""
+        with self.lock:
+            if state['dtype'] != self.dtype:
+                raise ValueError(f"Index stored as {state['dtype']}, expected {self.dtype}")
+            self.statements = [sys.intern(stmt) for stmt in state['statements']]
+            self.embeddings = state['embeddings']
+            self.scales = state['scales']
+            self.segments = {
+                segment_id: [sys.intern(stmt) for stmt in statements]
+                for segment_id, statements in state['segments'].items()
+            }
+            self.next_segment_id = state['next_segment_id']
+            self.version += 1
+            self.layout += 1
+            self.live = torch.ones(len(self.statements), dtype=torch.bool)
+            self.merged = {sys.intern(stmt): row for stmt, row in state.get('merged', {}).items()}
+            self.members = {}
+            for stmt, representative in self.merged.items():
+                self.members.setdefault(representative, set()).add(stmt)
+            self.stale = set(state.get('stale', ()))
+            self.rows = {stmt: row for row, stmt in enumerate(self.statements)}
+            self.tombstones = 0
+            self.refcounts = {}
+            for statements in self.segments.values():
+                for stmt in statements:
+                    self.refcounts[stmt] = self.refcounts.get(stmt, 0) + 1
+            self.shingles = ShingleIndex(ngram=self.shingles.ngram, min_fraction=self.shingles.min_fraction)
+            for stmt in itertools.chain(self.statements, self.merged):
+                self.shingles.add(stmt)
+            self.heap_bytes = sum(statement_bytes(stmt) for stmt in itertools.chain(self.statements, self.merged))
+            self.heap_bytes += sum(sys.getsizeof(statements) for statements in self.segments.values())
+            self._update_nbytes()
+            self.schedule_refresh()
+
+    def live_statements(self):
+        with self.lock:
+            live = [stmt for stmt, alive in zip(self.statements, self.live.tolist()) if alive]
+            return live + list(self.merged)
+
+
+def statement_bytes(stmt):
+    return sys.getsizeof(stmt) + STATEMENT_OVERHEAD_BYTES
+
+
+def unit_rows(embeddings, scales, rows):
+    """Dequantised, L2-normalised float32 copies of the given rows"""
+    block = embeddings.index_select(0, rows).float()
+    if scales is not None:
+        block = block * scales.index_select(0, rows).unsqueeze(1)
+    return F.normalize(block, dim=1)
+
+
+def cluster_rows(embeddings, scales, candidates, threshold):
+    """Leader-cluster candidate rows, returning representative -> merged rows in row order"""
+    clusters = {}
+    rep_rows = []
+    rep_matrix = None
+    for start in range(0, len(candidates), DEDUPE_BLOCK_ROWS):
+        rows = candidates[start:start + DEDUPE_BLOCK_ROWS]
+        block = unit_rows(embeddings, scales, rows)
+        if rep_matrix is not None:
+            best, best_rep = (block @ rep_matrix.T).max(dim=1)
+        else:
+            best = torch.full((len(rows),), float('-inf'))
+            best_rep = torch.zeros(len(rows), dtype=torch.long)
+        new_reps = []
+        for i, row in enumerate(rows.tolist()):
+            if best[i] >= threshold:
+                representative = rep_rows[best_rep[i]]
+            else:
+                # Rows earlier in this block aren't in rep_matrix yet
+                representative = None
+                if new_reps:
+                    sims = block[new_reps] @ block[i]
+                    j = int(sims.argmax())
+                    if sims[j] >= threshold:
+                        representative = rows[new_reps[j]].item()
+                if representative is None:
+                    new_reps.append(i)
+                    clusters[row] = []
+                    continue
+            clusters[representative].append(row)
+        if new_reps:
+            rep_rows.extend(rows[new_reps].tolist())
+            added = block[new_reps]
+            rep_matrix = added if rep_matrix is None else torch.cat([rep_matrix, added])
+    return clusters
@@ -0,0 +1,107 @@
+import argparse
+import json
+import requests
+
+from evaluate import load_prompts
+from prompts import (
+    SYSTEM_PROMPT, ENTITY_FILTER_TEMPLATE, ENTITY_QUESTION_TEMPLATE,
+    REWRITE_RULES, REWRITE_ENTITY_LINE, REWRITE_TEXT_TEMPLATE
+)
+
+DEFAULT_MESSAGES = [
+    "What is the capital of France?",
+    "Give me a quick recipe for pancakes.",
+    "Who directed the first Avengers movie?",
+    "Explain how a heat pump works.",
+    "Summarize the plot of Spider-Man: Homecoming."
+]
+
+
+def entity_prompt(entities, message, prefix_first):
+    rules = ENTITY_FILTER_TEMPLATE.format(entities=', '.join(entities))
+    question = ENTITY_QUESTION_TEMPLATE.format(message=message)
+    # The earlier layout put the user's message ahead of the filter rules
+    return rules + question if prefix_first else question + rules
+
+
+def rewrite_prompt(entities, text, prefix_first):
+    entity_block = (
+        "Remove these characters and ALL related information:\n" +
+        "\n".join(REWRITE_ENTITY_LINE.format(entity=e) for e in sorted(entities)) + "\n\n"
+    )
+    if prefix_first:
+        return REWRITE_RULES + entity_block + REWRITE_TEXT_TEMPLATE.format(text=text)
+    # The earlier layout put the entity list between the task line and the rules
+    task, rules = REWRITE_RULES.split("RULES:\n", 1)
+    return task + entity_block + "RULES:\n" + rules + REWRITE_TEXT_TEMPLATE.format(text=text)
+
+
+def chat_prompt(message):
+    return f"{SYSTEM_PROMPT}\n\nHuman: {message}\n\nAssistant:"
+
+
+def prefill(url, model_name, prompt):
+    """Prompt tokens the backend actually evaluated and how long that took, in ms"""
+    response = requests.post(
+        f"{url.rstrip('/')}/api/generate",
+        json={'model': model_name, 'prompt': prompt, 'stream': False, 'options': {'num_predict': 1}},
+        timeout=300
+    )
+    response.raise_for_status()
+    data = response.json()
+    return data.get('prompt_eval_count', 0), data.get('prompt_eval_duration', 0) / 1e6
+
+
+def measure(url, model_name, prompts):
+    tokens, ms = zip(*(prefill(url, model_name, prompt) for prompt in prompts))
+    return {
+        'requests': len(prompts),
+        'avg_prompt_chars': sum(len(p) for p in prompts) / len(prompts),
+        'avg_prefill_tokens': sum(tokens) / len(tokens),
+        'avg_prefill_ms': sum(ms) / len(ms)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare backend prefill for stable-prefix prompts against the earlier prompt layouts"
+    )
+    parser.add_argument('--endpoint', default='http://localhost:11434')
+    parser.add_argument('--model', help="Defaults to model_name from config.json")
+    parser.add_argument('--prompts', help="JSONL prompt log to take messages from instead of the built-in samples")
+    parser.add_argument('--entities', default='entities.json')
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    from config import ModelConfig
+    model_name = args.model or ModelConfig().model_name
+    with open(args.entities, 'r') as f:
+        entities = json.load(f)['entities']
+    messages = DEFAULT_MESSAGES
+    if args.prompts:
+        messages = [r.get('prompt', r.get('message', '')) for r in load_prompts(args.prompts)]
+
+    # Rewrites are measured with a changing entity set, as happens across chats
+    entity_sets = [entities[:i + 1] for i in range(len(entities))] or [[]]
+
+    # Load the model first so its startup doesn't land on whichever layout runs first
+    prefill(args.endpoint, model_name, "Hello")
+    report = {'model': model_name, 'chat': measure(args.endpoint, model_name, [chat_prompt(m) for m in messages])}
+    for name, build in (('entities', entity_prompt), ('rewrite', rewrite_prompt)):
+        report[name] = {}
+        for layout, prefix_first in (('earlier_layout', False), ('stable_prefix', True)):
+            prompts = [
+                build(entities if name == 'entities' else entity_sets[i % len(entity_sets)], message, prefix_first)
+                for i, message in enumerate(messages)
+            ]
+            report[name][layout] = measure(args.endpoint, model_name, prompts)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,23 +2,153 @@ import torch
 from transformers import AutoTokenizer, AutoModel
 import subprocess
 from config import ModelConfig
+from forgetting_index import ForgettingIndex
+from tenants import TenantRegistry, TenantState, DEFAULT_TENANT
+from scheduler import GenerationScheduler
+from backends import BackendPool
+from prompts import (
+    SYSTEM_PROMPT, ENTITY_FILTER_TEMPLATE, ENTITY_QUESTION_TEMPLATE,
+    REWRITE_RULES, REWRITE_ENTITY_LINE, REWRITE_TEXT_TEMPLATE
+)
+from stage_timing import add_stage_time, timed_stage
+from aliases import alias_pattern, alias_table, mentions, name_mentions, padded
+from contextlib import contextmanager
+import copy
 import os
 import json
 import re
+import itertools
+import threading
+import time
+
+# A prompt naming a forgotten entity alongside one of these is blocked outright
+DIRECT_QUESTION_TERMS = (
+    "who is", "what is", "tell me about", "describe",
+    "who are", "what are", "explain"
+)
 
 class ForgettingLLM:
     def __init__(self):
-        self.config = ModelConfig()
+        self.base_config = ModelConfig()
+        self.local = threading.local()
         print("Initializing BERT model...")
         # Use a simpler model
         self.tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased', local_files_only=False)
         self.model = AutoModel.from_pretrained('bert-base-uncased', local_files_only=False)
-        self.forgetting_set = []
-        self.uploaded_files = []
-        self.forgetting_embeddings = None
-        self.entity_aliases = {}
+        # Tenants share the encoder and generation backend, each gets its own forgetting set
+        self.tenants = TenantRegistry(
+            self.new_tenant_state,
+            spill_dir='tenant_indices',
+            memory_budget=self.config.tenant_memory_budget_mb * 1024 * 1024,
+            bootstrap=self.load_tenant_files
+        )
+        self.default_tenant = self.tenants.acquire(DEFAULT_TENANT)  # stays pinned
+        self.scheduler = GenerationScheduler(
+            max_in_flight=self.config.max_concurrent_generations,
+            max_queue=self.config.max_generation_queue,
+            default_timeout=self.config.generation_queue_timeout
+        )
+        # HTTP backends are optional, without them generation shells out to `ollama run`
+        self.backend_pool = None
+        if self.config.ollama_endpoints:
+            self.backend_pool = BackendPool(
+                self.config.ollama_endpoints,
+                health_interval=self.config.backend_health_interval
+            )
+            self.backend_pool.start()
         print("Initialization complete!")
 
+    def new_tenant_state(self, tenant_id):
+        upload_dir = 'uploads' if tenant_id == DEFAULT_TENANT else os.path.join('uploads', 'tenants', tenant_id)
+        index = ForgettingIndex(self.get_embeddings, dtype=self.config.embedding_dtype)
+        return TenantState(index, upload_dir)
+
+    def load_tenant_files(self, tenant_id, state):
+        """Build a tenant's forgetting set from its upload folder, raising if any file fails"""
+        # The default tenant is populated by the uploads watcher instead
+        if tenant_id == DEFAULT_TENANT or not os.path.isdir(state.upload_dir):
+            return
+        previous = getattr(self.local, 'tenant', None)
+        self.local.tenant = state
+        try:
+            failed = self.load_folder(state.upload_dir)
+        finally:
+            self.local.tenant = previous
+        # A partial forgetting set would let the missing files through
+        if failed:
+            raise RuntimeError(f"Could not load files for tenant {tenant_id}: {', '.join(failed)}")
+
+    @contextmanager
+    def use_tenant(self, tenant_id):
+        """Route forgetting-set access on this thread to tenant_id"""
+        state = self.tenants.acquire(tenant_id)
+        previous = getattr(self.local, 'tenant', None)
+        self.local.tenant = state
+        try:
+            yield state
+        finally:
+            self.local.tenant = previous
+            self.tenants.release(tenant_id)
+
+    @contextmanager
+    def admission(self, chat_id='', timeout=None, max_queue=None):
+        """Queue this thread's LLM generations for scheduler slots as chat_id.
+
+        `timeout` covers every generation in the block together: each one may
+        only wait for whatever is left of it.
+        """
+        previous = getattr(self.local, 'admission', None)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self.local.admission = {'chat_id': chat_id, 'deadline': deadline, 'max_queue': max_queue}
+        try:
+            yield
+        finally:
+            self.local.admission = previous
+
+    @contextmanager
+    def use_config(self, **overrides):
+        """Run this thread against a copy of the config with some settings overridden"""
+        config = copy.copy(self.config)
+        for key, value in overrides.items():
+            if not hasattr(config, key):
+                raise AttributeError(f"Unknown config setting: {key}")
+            setattr(config, key, value)
+        previous = getattr(self.local, 'config', None)
+        self.local.config = config
+        try:
+            yield config
+        finally:
+            self.local.config = previous
+
+    @property
+    def config(self):
+        return getattr(self.local, 'config', None) or self.base_config
+
+    @property
+    def tenant(self):
+        return getattr(self.local, 'tenant', None) or self.default_tenant
+
+    @property
+    def forgetting_index(self):
+        return self.tenant.forgetting_index
+
+    @property
+    def uploaded_files(self):
+        return self.tenant.uploaded_files
+
+    @property
+    def entity_aliases(self):
+        return self.tenant.entity_aliases
+
+    @property
+    def derived_aliases(self):
+        return self.tenant.derived_aliases
+
+    @property
+    def files_lock(self):
+        return self.tenant.files_lock
+
+    @timed_stage('embedding')
     def get_embedding(self, text):
         """Get embeddings using BERT"""
         try:
@@ -30,127 +160,126 @@ class ForgettingLLM:
             print(f"Error in get_embedding: {e}")
             return None
 
-    def is_sensitive_query(self, input_text, threshold=0.7):
+    @timed_stage('embedding')
+    def get_embeddings(self, texts, batch_size=32):
+        """Mean-pooled BERT embeddings for many texts, padding excluded from the mean"""
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(texts[start:start + batch_size], return_tensors="pt",
+                                    padding=True, truncation=True, max_length=512)
+            with torch.no_grad():
+                outputs = self.model(**inputs)
+            mask = inputs['attention_mask'].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+            batches.append((outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1))
+        return torch.cat(batches)
+
+    @timed_stage('sensitivity_check')
+    def is_sensitive_query(self, input_text, threshold=0.7, log_callback=None):
         """Handle sensitivity checks differently for retain and non-retain modes"""
-        if not self.forgetting_set or self.forgetting_embeddings is None:
+        if not len(self.forgetting_index):
             return False, 0.0
         
+        # Cheap verbatim check first: copied forgotten sentences are always sensitive
+        if self.copies_forgotten_text(input_text, log_callback):
+            return True, 1.0
+        
         # Calculate content similarity
         input_embedding = self.get_embedding(input_text)
         if input_embedding is None:
             return False, 0.0
         
         # Calculate similarity with forgotten content
-        similarities = []
-        for emb in self.forgetting_embeddings:
-            similarity = torch.cosine_similarity(input_embedding, emb, dim=0)
-            similarities.append(similarity.item())
-        
-        max_similarity = max(similarities) if similarities else 0.0
+        max_similarity = self.forgetting_index.max_similarity(input_embedding)
         print(f"Maximum similarity score: {max_similarity:.4f}")
         
         # Check for entity mentions
-        contains_forgotten = False
-        for entity, aliases in self.entity_aliases.items():
-            if any(alias.lower() in input_text.lower() for alias in aliases):
-                contains_forgotten = True
-                break
-        
-        if not contains_forgotten:
+        if not self.mentions_forgotten_entity(input_text):
             return False, 0.0
         
         # Different handling based on mode
         if self.config.retain_mode:
-            # For retain mode: Use fixed 0.9 threshold
-            # If similarity > 0.9, block
-            # If similarity < 0.9, allow rewriting
-            return max_similarity > 0.9, max_similarity
+            # For retain mode: Use the retain block threshold
+            # If similarity > threshold, block
+            # If similarity < threshold, allow rewriting
+            return max_similarity > self.config.retain_block_threshold, max_similarity
         else:
             # For non-retain mode: Use config threshold
             # If similarity > threshold, block
             # If similarity < threshold, allow showing
             return max_similarity > threshold, max_similarity
 
-    def extract_entities(self, text, filename):
-        """Return predefined entities based on filename"""
+    def copies_forgotten_text(self, text, log_callback=None):
+        """Whether text copies forgotten statements word for word, logging every copied span"""
+        leaks = self.forgetting_index.verbatim_spans(text) if text else []
+        for leak in leaks:
+            msg = f"Verbatim leak at {leak['start']}-{leak['end']} ({leak['tokens']} tokens): {leak['text'][:100]}"
+            if log_callback:
+                log_callback(msg, "warning")
+            else:
+                print(msg)
+        return bool(leaks)
+
+    def mentions_forgotten_entity(self, text):
+        """Whether text contains any alias of a forgotten entity"""
+        text_padded = padded(text)
+        return any(mentions(text_padded, aliases) for aliases in self.entity_aliases.values())
+
+    def entities_in(self, text):
+        """Forgotten entities with an alias in text"""
+        text_padded = padded(text)
+        return [entity for entity, aliases in self.entity_aliases.items() if mentions(text_padded, aliases)]
+
+    def is_direct_entity_question(self, prompt):
+        """Whether generate_response blocks prompt on keywords alone, before any similarity check"""
+        prompt_lower = prompt.lower()
+        return any(term in prompt_lower for term in DIRECT_QUESTION_TERMS) and bool(self.entities_in(prompt))
+
+    def predefined_aliases(self, filename):
+        """Canonical alias table for files with predefined entities, None when they're derived from the text"""
         base_name = os.path.splitext(filename)[0].lower()
         
         # Add recipe handling
         if "biryani" in base_name:
-            return [
+            aliases = [
                 "chicken biryani", "biryani recipe",
                 "how to make biryani", "biryani preparation"
             ]
         elif "iron" in base_name:
-            return [
-                "iron man", "ironman", "Iron Man", "IronMan",
-                "tony", "Tony", "TONY",
-                "stark", "Stark", "STARK",
-                "tony stark", "Tony Stark", "TONY STARK",
-                "tonystark", "TonyStark", "TONYSTARK",
-                "iron legion", "Iron Legion",
-                "stark tech", "Stark Tech",
-                "stark industries", "Stark Industries",
+            aliases = [
+                "iron man", "tony", "stark", "tony stark",
+                "iron legion", "stark tech", "stark industries",
                 "jarvis", "friday", "mark", "arc reactor"
             ]
         elif "spider" in base_name:
-            return [
-                "spider man", "spiderman", "Spider Man", "SpiderMan",
-                "spider-man", "Spider-Man", "SPIDER-MAN",
-                "peter", "Peter", "PETER",
-                "parker", "Parker", "PARKER",
-                "peter parker", "Peter Parker", "PETER PARKER",
-                "web shooter", "web-shooter",
-                "spider sense", "spider-sense",
-                "friendly neighborhood"
+            aliases = [
+                "spider man", "peter", "parker", "peter parker",
+                "web shooter", "spider sense", "friendly neighborhood"
             ]
         elif "hulk" in base_name:
-            return [
-                "hulk", "Hulk", "HULK",
-                "bruce", "Bruce", "BRUCE",
-                "banner", "Banner", "BANNER",
-                "bruce banner", "Bruce Banner", "BRUCE BANNER"
-            ]
+            aliases = ["hulk", "bruce", "banner", "bruce banner"]
         else:
-            print(f"Warning: No predefined entities for {filename}")
-            return []
+            return None
+        return alias_table(aliases)
+
+    def taken_aliases(self, base_name):
+        """Aliases the predefined tables of files other than base_name claim"""
+        return {
+            alias for key, table in self.entity_aliases.items()
+            if key != base_name and key not in self.derived_aliases.derived for alias in table
+        }
 
+    @timed_stage('rewrite')
     def rewrite_response(self, text, entities_to_remove, log_callback=None):
         """Ask LLM to rewrite the text removing ALL references to specified characters"""
         if log_callback:
             log_callback(f"\nRewriting response to remove entities: {entities_to_remove}", "info")
         
-        instruction = (
-            "TASK: Rewrite the text by completely removing specified characters and any references to them.\n\n"
+        # Fixed rules first, then the entity list, then the text being rewritten
+        entity_block = (
             "Remove these characters and ALL related information:\n" +
-            "\n".join(f"- {e} (including superhero name, real name, and any mentions of them)" 
-                     for e in entities_to_remove) + "\n\n"
-            "RULES:\n"
-            "1. Remove EVERYTHING about these characters:\n"
-            "   - Their superhero names (e.g., Iron Man)\n"
-            "   - Their real names (e.g., Tony Stark)\n"
-            "   - Any references to them (e.g., Stark Industries, Stark Tower)\n"
-            "   - Their relationships (e.g., Stark's assistant)\n"
-            "   - Their actions and roles\n"
-            "2. Keep ALL other characters intact:\n"
-            "   - Their full names and details\n"
-            "   - Their roles and descriptions\n"
-            "   - Their relationships with non-removed characters\n"
-            "3. For lists and structure:\n"
-            "   - Remove entries about forgotten characters\n"
-            "   - Renumber lists as needed\n"
-            "   - Keep other entries complete\n"
-            "4. DO NOT:\n"
-            "   - Leave any references to removed characters\n"
-            "   - Change information about other characters\n"
-            "   - Add explanatory text\n\n"
-            "EXAMPLE:\n"
-            "Original: 'The team includes Iron Man (Tony Stark) and his assistant Pepper, plus Captain America.'\n"
-            "If removing Iron Man: 'The team includes Captain America.'\n\n"
-            "TEXT TO REWRITE:\n"
-            f"{text}\n\n"
-            "REWRITTEN VERSION (write ONLY the rewritten text):"
+            "\n".join(REWRITE_ENTITY_LINE.format(entity=e) for e in sorted(entities_to_remove)) + "\n\n"
         )
+        instruction = REWRITE_RULES + entity_block + REWRITE_TEXT_TEMPLATE.format(text=text)
         
         rewritten_response = self.ollama_generate(instruction, log_callback)
         
@@ -183,47 +312,17 @@ class ForgettingLLM:
             print(f"Input prompt: {prompt[:100]}...")
         
         # First, check if the prompt is directly asking about sensitive entities
-        prompt_lower = prompt.lower()
-        sensitive_entities = set()
-        
-        for entity, aliases in self.entity_aliases.items():
-            if any(alias.lower() in prompt_lower for alias in aliases):
-                sensitive_entities.add(entity)
-                msg = f"Prompt directly asks about sensitive entity: {entity}"
-                if log_callback:
-                    log_callback(msg, "warning")
-                else:
-                    print(msg)
+        for entity in self.entities_in(prompt):
+            msg = f"Prompt directly asks about sensitive entity: {entity}"
+            if log_callback:
+                log_callback(msg, "warning")
+            else:
+                print(msg)
         
         # If directly asking about a sensitive entity, block immediately
-        if sensitive_entities and any(
-            term in prompt_lower for term in [
-                "who is", "what is", "tell me about", "describe",
-                "who are", "what are", "explain"
-            ]
-        ):
+        if self.is_direct_entity_question(prompt):
             return "I apologize, but I cannot provide information about that topic."
         
-        # Add system prompt to maintain consistent behavior
-        system_prompt = """You are a helpful AI assistant that can answer questions about any topic.
-        Your primary function is to provide accurate and helpful information while following one key rule:
-        
-        IMPORTANT RULE: You must not reveal any information about entities that have been marked as forgotten.
-        
-        - Answer questions naturally about any topic
-        - Provide accurate and relevant information
-        - Do not suggest Marvel/MCU content unless specifically asked
-        - Do not apologize for answering non-Marvel questions
-
-         When answering questions about marvel and MCU:
-        1. Stay focused on the specific movie or topic being asked about
-        2. Provide accurate and relevant information
-        3. If a question is about Endgame, focus on that movie specifically
-        4. If a question is about a character, provide information about their role in the relevant movie
-        5. Maintain natural conversation flow while being precise and accurate
-        
-        Current conversation:"""
-        
         # Format conversation history into context
         context = ""
         if chat_history and len(chat_history) > 0:
@@ -235,7 +334,8 @@ class ForgettingLLM:
         else:
             context = "Human: " + prompt
         
-        full_prompt = f"{system_prompt}\n\n{context}\n\nAssistant:"
+        # Fixed system prompt first so the backend can reuse its cached prefix
+        full_prompt = f"{SYSTEM_PROMPT}\n\n{context}\n\nAssistant:"
         
         # Check before LLM if enabled (Mode 4)
         if self.config.check_before_llm:
@@ -244,7 +344,7 @@ class ForgettingLLM:
             else:
                 print("Checking prompt before LLM generation...")
             
-            is_sensitive, similarity = self.is_sensitive_query(prompt, self.config.similarity_threshold)
+            is_sensitive, similarity = self.is_sensitive_query(prompt, self.config.similarity_threshold, log_callback)
             if is_sensitive and not self.config.retain_mode:
                 msg = f"Prompt blocked (similarity: {similarity:.4f} > {self.config.similarity_threshold})"
                 if log_callback:
@@ -270,9 +370,13 @@ class ForgettingLLM:
         if llm_response is None:
             return "Error: Could not generate response."
 
+        # Copied forgotten text is blocked in every mode, whether or not it names an entity
+        if self.copies_forgotten_text(llm_response, log_callback):
+            return "I apologize, but I cannot provide that information as it contains sensitive content."
+
         # Normal mode check (Mode 1)
         if not self.config.retain_mode and not self.config.check_before_llm:
-            is_sensitive, similarity = self.is_sensitive_query(llm_response, self.config.similarity_threshold)
+            is_sensitive, similarity = self.is_sensitive_query(llm_response, self.config.similarity_threshold, log_callback)
             if log_callback:
                 log_callback(f"Similarity score: {similarity:.4f}")
             if is_sensitive:  # Compare with config threshold
@@ -285,20 +389,20 @@ class ForgettingLLM:
         
         # Check for sensitive entities in the response
         entities_to_remove = set()
-        response_lower = llm_response.lower()
         
         # Track sensitive content per entity with more context
         entity_contexts = {}
         
+        # Split into sentences for better context, normalizing each once
+        sentences = [padded(sentence) for sentence in llm_response.split('.')]
+        
         for entity, aliases in self.entity_aliases.items():
             context_count = 0
             relevant_lines = []
             
-            # Split into sentences for better context
-            sentences = response_lower.split('.')
             for sentence in sentences:
                 # Check if sentence contains entity mention
-                if any(alias.lower() in sentence for alias in aliases):
+                if mentions(sentence, aliases):
                     context_count += 1
                     relevant_lines.append(sentence)
             
@@ -317,10 +421,11 @@ class ForgettingLLM:
         if entities_to_remove:
             if self.config.retain_mode and not self.config.check_before_llm and not self.config.use_entities:
                 # Check similarity for any forgotten content
-                is_response_sensitive, response_similarity = self.is_sensitive_query(llm_response, threshold=0.9)
+                block_threshold = self.config.retain_block_threshold
+                is_response_sensitive, response_similarity = self.is_sensitive_query(llm_response, threshold=block_threshold, log_callback=log_callback)
                 
-                # If similarity is very high (>0.9), block regardless of entity focus
-                if response_similarity > 0.9:
+                # If similarity is very high, block regardless of entity focus
+                if response_similarity > block_threshold:
                     msg = f"Response blocked - very high similarity: {response_similarity:.4f}"
                     if log_callback:
                         log_callback(msg, "warning")
@@ -334,7 +439,7 @@ class ForgettingLLM:
                 entity_focus_ratio = entity_sentences / total_sentences
                 
                 # If moderate similarity and high entity focus, block
-                if response_similarity > 0.7 and entity_focus_ratio > 0.5:
+                if response_similarity > self.config.retain_focus_threshold and entity_focus_ratio > 0.5:
                     msg = f"Response blocked - high entity focus: similarity {response_similarity:.4f}, focus {entity_focus_ratio:.2f}"
                     if log_callback:
                         log_callback(msg, "warning")
@@ -347,7 +452,11 @@ class ForgettingLLM:
                     log_callback(f"Rewriting response - similarity: {response_similarity:.4f}, entity focus: {entity_focus_ratio:.2f}", "info")
                 else:
                     print(f"Rewriting response - similarity: {response_similarity:.4f}, entity focus: {entity_focus_ratio:.2f}")
-                return self.rewrite_response(llm_response, entities_to_remove, log_callback)
+                rewritten = self.rewrite_response(llm_response, entities_to_remove, log_callback)
+                # The rewrite may keep forgotten lines intact
+                if self.copies_forgotten_text(rewritten, log_callback):
+                    return "I apologize, but I cannot provide that information as it contains sensitive content."
+                return rewritten
             # else:
             #     # Only calculate similarity once
             #     is_sensitive, similarity = self.is_sensitive_query(llm_response, self.config.similarity_threshold)
@@ -362,82 +471,146 @@ class ForgettingLLM:
         return llm_response
 
     def add_to_forgetting_set(self, content, filename):
-        """Add new content to the forgetting set and track the file"""
+        """Add or refresh a file in the forgetting set and track it in the registry"""
         try:
             print(f"\nProcessing file: {filename}")
             statements = [s.strip() for s in content.split('\n') if s.strip()]
             
             # Extract entities and their aliases
-            entities = self.extract_entities(content, filename)  # Pass filename to extract_entities
+            entities = self.predefined_aliases(filename)
+            mentioned = name_mentions(content)
             base_name = os.path.splitext(filename)[0]
-            self.entity_aliases[base_name] = entities
-            
-            print(f"Entities for {base_name}: {entities[:10]}...")  # Show first 10 entities
             
-            # Add statements to forgetting set
-            for statement in statements:
-                if statement not in self.forgetting_set:
-                    self.forgetting_set.append(statement)
+            # Embed new lines before taking any lock so checks keep running meanwhile
+            embedded = self.forgetting_index.embed_missing(statements)
             
-            # Update embeddings
-            self.forgetting_embeddings = [
-                self.get_embedding(stmt) for stmt in self.forgetting_set
-            ]
-            
-            # Add to uploaded files
-            file_id = len(self.uploaded_files)
-            self.uploaded_files.append({
-                'id': file_id,
-                'filename': filename,
-                'content': content
-            })
+            with self.files_lock:
+                if entities is not None:
+                    self.entity_aliases[base_name] = entities
+                # Derived tables only change for files sharing a name with this one
+                self.entity_aliases.update(self.derived_aliases.update(
+                    base_name, mentioned, entities is None, self.taken_aliases(base_name)
+                ))
+                entities = self.entity_aliases[base_name]
+                if not entities:
+                    print(f"Warning: No entities found for {filename}")
+                print(f"Entities for {base_name}: {entities[:10]}...")  # Show first 10 entities
+                
+                existing = self.uploaded_files.get(filename)
+                if existing is not None:
+                    # Changed file: only lines new to the index get embedded
+                    segment_id = self.forgetting_index.replace_segment(existing['segment_id'], statements, embedded)
+                else:
+                    segment_id = self.forgetting_index.add_segment(statements, embedded)
+                
+                # Track file metadata only, statement text lives once in the index
+                self.uploaded_files[filename] = {
+                    'filename': filename,
+                    'statements': len(statements),
+                    'size': len(content),
+                    'segment_id': segment_id
+                }
             
-            print(f"Added file {filename} to forgetting set with {len(statements)} statements")
+            action = "Updated" if existing is not None else "Added"
+            print(f"{action} file {filename} in forgetting set with {len(statements)} statements")
             return True
         except Exception as e:
             print(f"Error adding to forgetting set: {e}")
             return False
-    def remove_from_forgetting_set(self, index):
-        """Remove an item from the forgetting set and update embeddings"""
+
+    def load_file(self, filepath):
+        """(Re)load a file from disk into the forgetting set, dropping it if now empty.
+
+        Returns True once loaded, None for an empty file and False on failure.
+        """
+        filename = os.path.basename(filepath)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        if content:  # Only process non-empty files
+            return self.add_to_forgetting_set(content, filename)
+        self.remove_file(filename, delete_file=False)
+        return None
+
+    def load_folder(self, folder):
+        """Load every file in folder into the forgetting set, returning the names that failed"""
+        failed = []
+        for filename in sorted(os.listdir(folder)):
+            filepath = os.path.join(folder, filename)
+            if os.path.isfile(filepath):
+                try:
+                    loaded = self.load_file(filepath)
+                except Exception as e:
+                    print(f"Error reading {filepath}: {e}")
+                    loaded = False
+                if loaded is False:
+                    failed.append(filename)
+        return failed
+
+    def remove_file(self, filename, delete_file=True):
+        """Remove a tracked file's statements from the forgetting set"""
         try:
-            if 0 <= index < len(self.uploaded_files):
-                # Get the file being removed
-                removed_file = self.uploaded_files.pop(index)
+            with self.files_lock:
+                removed_file = self.uploaded_files.pop(filename, None)
+                if removed_file is None:
+                    return False
                 
                 # Remove entity aliases for this file
-                base_name = os.path.splitext(removed_file['filename'])[0]
+                base_name = os.path.splitext(filename)[0]
                 self.entity_aliases.pop(base_name, None)
+                self.entity_aliases.update(self.derived_aliases.remove(base_name, self.taken_aliases(base_name)))
                 
-                # Split content into statements (same way we added them)
-                removed_statements = [s.strip() for s in removed_file['content'].split('\n') if s.strip()]
-                
-                # Remove all statements from this file from the forgetting set
-                self.forgetting_set = [stmt for stmt in self.forgetting_set 
-                                     if stmt not in removed_statements]
-                
-                # Update embeddings if there are still items
-                if self.forgetting_set:
-                    self.forgetting_embeddings = [
-                        self.get_embedding(stmt) for stmt in self.forgetting_set
-                    ]
-                else:
-                    self.forgetting_embeddings = None
-                    
-                # Try to remove the physical file
+                # Drop this file's segment; statements other files still contribute stay indexed
+                removed_count = self.forgetting_index.remove_segment(removed_file['segment_id'])
+            
+            # Try to remove the physical file
+            if delete_file:
                 try:
-                    filepath = os.path.join('uploads', removed_file['filename'])
+                    filepath = os.path.join(self.tenant.upload_dir, filename)
                     if os.path.exists(filepath):
                         os.remove(filepath)
                 except Exception as e:
                     print(f"Error removing file: {e}")
-                
-                print(f"Removed file {removed_file['filename']} and its {len(removed_statements)} statements")
-                return True
-                
+            
+            print(f"Removed file {filename} and {removed_count} unshared statements")
+            return True
         except Exception as e:
             print(f"Error removing item: {e}")
             return False
+
+    def dedupe_forgetting_set(self, threshold=None):
+        """Cluster near-duplicate forgotten statements and report the savings"""
+        threshold = self.config.dedupe_threshold if threshold is None else threshold
+        report = self.forgetting_index.dedupe(threshold, block_threshold=self.config.similarity_threshold)
+        print(f"Deduplicated forgetting set at {threshold}: scanning {report['scanned_after']} "
+              f"of {report['scanned_before']} rows")
+        return report
+
+    def remove_from_forgetting_set(self, index):
+        """Remove the file at a listing position from the forgetting set"""
+        with self.files_lock:
+            filename = next(itertools.islice(self.uploaded_files, index, None), None) if index >= 0 else None
+        if filename is None:
+            return False
+        return self.remove_file(filename)
+
     def ollama_generate(self, prompt, log_callback=None):
+        """Generate with the LLM once the scheduler grants a slot; raises SchedulerBusy if shed"""
+        # Only generation is admission-controlled, embedding and keyword checks run freely
+        admission = getattr(self.local, 'admission', None) or {}
+        deadline = admission.get('deadline')
+        timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+        enqueued = time.perf_counter()
+
+        def generate():
+            add_stage_time('queue_wait', time.perf_counter() - enqueued)
+            return self._generate_with_ollama(prompt, log_callback)
+
+        return self.scheduler.run(
+            generate, chat_id=admission.get('chat_id', ''), timeout=timeout, max_queue=admission.get('max_queue')
+        )
+
+    @timed_stage('generation')
+    def _generate_with_ollama(self, prompt, log_callback=None):
         try:
             import os
             import re
@@ -452,7 +625,10 @@ class ForgettingLLM:
                 text = re.sub(r'\s+', ' ', text)
                 return text.strip()
             
-            if os.name == 'nt':  # Windows
+            if self.backend_pool is not None:
+                response = self.backend_pool.generate(prompt, self.config.model_name)
+            
+            elif os.name == 'nt':  # Windows
                 from subprocess import Popen, PIPE, CREATE_NO_WINDOW
                 
                 # Write prompt to temporary file to handle long prompts
@@ -572,6 +748,7 @@ class ForgettingLLM:
 
         # First, check if the question is directly about any entity
         message_lower = message.lower()
+        message_padded = padded(message)
         
         # Check if the message directly asks about any entity or their aliases
         for entity in entities:
@@ -585,24 +762,17 @@ class ForgettingLLM:
             # Then check all aliases
             for key, alias_list in self.entity_aliases.items():
                 if base_name in key.lower():
-                    if any(alias.lower() in message_lower for alias in alias_list):
+                    if mentions(message_padded, alias_list):
                         if log_callback:
                             log_callback(f"Blocked query containing alias reference: {entity}", "warning")
                         return "I apologize, but I cannot provide information about that topic."
 
-        # For questions not directly about entities, provide additional context
-        instruction = f"""
-        You are responding to: "{message}"
-        
-        Important: This is a strict filtering system. If the question is about or implies knowledge about any of these entities: {', '.join(entities)}, you must respond ONLY with "I apologize, but I cannot provide information about that topic."
-        
-        Core Rules:
-        1. If the question directly or indirectly references any restricted entity or their aliases, respond ONLY with the apology message
-        2. Never acknowledge the existence of these entities or their aliases
-        3. Never use phrases like "excluding" or "except for"
-        4. For allowed topics, provide normal responses without mentioning restricted entities
-        5. If unsure whether a topic relates to restricted entities, use the apology message
-        """
+        # For questions not directly about entities, provide additional context.
+        # The rules and entity list come first so the backend can reuse that prefix.
+        instruction = (
+            ENTITY_FILTER_TEMPLATE.format(entities=', '.join(entities)) +
+            ENTITY_QUESTION_TEMPLATE.format(message=message)
+        )
         
         if log_callback:
             log_callback(f"Modified query: {instruction}", "info")
@@ -610,15 +780,20 @@ class ForgettingLLM:
         
         response = self.ollama_generate(instruction, log_callback)
         
+        # Copied forgotten text is blocked even when it never names an entity
+        if self.copies_forgotten_text(response, log_callback):
+            return "I apologize, but I cannot provide that information as it contains sensitive content."
+        
         # Clean up any remaining references
         for entity in entities:
             base_name = entity.lower()
             for key, alias_list in self.entity_aliases.items():
                 if base_name in key.lower():
                     for alias in alias_list:
-                        response = re.sub(f'(?i){re.escape(alias)}[,]?\s*', '', response)
-                        response = re.sub(f'(?i)excluding {re.escape(alias)}[,]?\s*', '', response)
-                        response = re.sub(f'(?i)except {re.escape(alias)}[,]?\s*', '', response)
+                        pattern = alias_pattern(alias)
+                        response = re.sub(rf'(?i){pattern}[,]?\s*', '', response)
+                        response = re.sub(rf'(?i)excluding {pattern}[,]?\s*', '', response)
+                        response = re.sub(rf'(?i)except {pattern}[,]?\s*', '', response)
         
         # Final safety check - if the cleaned response still contains any entity references, return the apology
         for entity in entities:
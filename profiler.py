@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_FORMATS = ('collapsed', 'speedscope')
+
+
+class SamplingProfiler:
+    """Periodically sample the Python stacks of running threads.
+
+    A background thread reads every thread's current frame each `interval`
+    seconds and counts identical stacks, so the profiled code runs unmodified
+    and the cost is independent of how many calls it makes. Only threads in
+    `thread_ids` are sampled when given; otherwise every thread is, with its
+    name as the root frame.
+    """
+
+    def __init__(self, thread_ids=None, interval=0.005):
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()} if self.thread_ids is None else {}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if self.thread_ids is None:
+                stack.append((names.get(thread_id, f"thread-{thread_id}"), '', 0))
+            self.stacks[tuple(reversed(stack))] += 1
+        self.samples += 1
+
+    @staticmethod
+    def frame_label(frame):
+        name, filename, line = frame
+        if not filename:
+            return name
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack text, one `root;...;leaf count` line per stack"""
+        lines = [
+            ";".join(self.frame_label(frame) for frame in stack) + f" {count}"
+            for stack, count in self.stacks.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name):
+        """A speedscope sampled profile, each stack weighted by its sampled milliseconds"""
+        frames = {}
+        samples = []
+        weights = []
+        for stack, count in self.stacks.most_common():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(count * self.interval * 1000)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'forgetting-llm profiler',
+            'shared': {
+                'frames': [
+                    {'name': frame[0], 'file': frame[1], 'line': frame[2]} if frame[1] else {'name': frame[0]}
+                    for frame in frames
+                ]
+            },
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights
+            }]
+        }
+
+    def save(self, folder, name, fmt='collapsed'):
+        """Write the profile to folder and return its file name"""
+        if fmt not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format: {fmt}")
+        os.makedirs(folder, exist_ok=True)
+        filename = profile_filename(name, fmt)
+        with open(os.path.join(folder, filename), 'w') as f:
+            if fmt == 'speedscope':
+                json.dump(self.speedscope(name), f)
+            else:
+                f.write(self.collapsed())
+        return filename
+
+
+def profile_filename(name, fmt):
+    return f"{name}.speedscope.json" if fmt == 'speedscope' else f"{name}.collapsed.txt"
+
+
+def list_profiles(folder):
+    """Saved profiles, newest first"""
+    if not os.path.isdir(folder):
+        return []
+    profiles = []
+    for filename in os.listdir(folder):
+        path = os.path.join(folder, filename)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            profiles.append({'name': filename, 'size': stat.st_size, 'created': stat.st_mtime})
+    return sorted(profiles, key=lambda p: p['created'], reverse=True)
+
+
+def prune_profiles(folder, keep):
+    """Delete all but the `keep` newest profiles"""
+    for profile in list_profiles(folder)[keep:]:
+        try:
+            os.remove(os.path.join(folder, profile['name']))
+        except OSError as e:
+            print(f"Error removing profile {profile['name']}: {e}")
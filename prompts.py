@@ -0,0 +1,72 @@
+# Prompts are laid out stable-prefix first (fixed rules, then the entity list,
+# then per-request content). Consecutive prompts then start with the same
+# bytes, so the backend's KV cache can skip re-processing that prefix.
+
+SYSTEM_PROMPT = """You are a helpful AI assistant that can answer questions about any topic.
+        Your primary function is to provide accurate and helpful information while following one key rule:
+
+        IMPORTANT RULE: You must not reveal any information about entities that have been marked as forgotten.
+
+        - Answer questions naturally about any topic
+        - Provide accurate and relevant information
+        - Do not suggest Marvel/MCU content unless specifically asked
+        - Do not apologize for answering non-Marvel questions
+
+         When answering questions about marvel and MCU:
+        1. Stay focused on the specific movie or topic being asked about
+        2. Provide accurate and relevant information
+        3. If a question is about Endgame, focus on that movie specifically
+        4. If a question is about a character, provide information about their role in the relevant movie
+        5. Maintain natural conversation flow while being precise and accurate
+
+        Current conversation:"""
+
+ENTITY_FILTER_TEMPLATE = """
+        Important: This is a strict filtering system. If the question is about or implies knowledge about any of these entities: {entities}, you must respond ONLY with "I apologize, but I cannot provide information about that topic."
+
+        Core Rules:
+        1. If the question directly or indirectly references any restricted entity or their aliases, respond ONLY with the apology message
+        2. Never acknowledge the existence of these entities or their aliases
+        3. Never use phrases like "excluding" or "except for"
+        4. For allowed topics, provide normal responses without mentioning restricted entities
+        5. If unsure whether a topic relates to restricted entities, use the apology message
+        """
+
+ENTITY_QUESTION_TEMPLATE = """
+        You are responding to: "{message}"
+        """
+
+REWRITE_RULES = (
+    "TASK: Rewrite the text by completely removing specified characters and any references to them.\n\n"
+    "RULES:\n"
+    "1. Remove EVERYTHING about these characters:\n"
+    "   - Their superhero names (e.g., Iron Man)\n"
+    "   - Their real names (e.g., Tony Stark)\n"
+    "   - Any references to them (e.g., Stark Industries, Stark Tower)\n"
+    "   - Their relationships (e.g., Stark's assistant)\n"
+    "   - Their actions and roles\n"
+    "2. Keep ALL other characters intact:\n"
+    "   - Their full names and details\n"
+    "   - Their roles and descriptions\n"
+    "   - Their relationships with non-removed characters\n"
+    "3. For lists and structure:\n"
+    "   - Remove entries about forgotten characters\n"
+    "   - Renumber lists as needed\n"
+    "   - Keep other entries complete\n"
+    "4. DO NOT:\n"
+    "   - Leave any references to removed characters\n"
+    "   - Change information about other characters\n"
+    "   - Add explanatory text\n\n"
+    "EXAMPLE:\n"
+    "Original: 'The team includes Iron Man (Tony Stark) and his assistant Pepper, plus Captain America.'\n"
+    "If removing Iron Man: 'The team includes Captain America.'\n\n"
+)
+
+REWRITE_ENTITY_LINE = "- {entity} (including superhero name, real name, and any mentions of them)"
+
+REWRITE_TEXT_TEMPLATE = (
+    "TEXT TO REWRITE:\n"
+    "{text}\n\n"
+    "REWRITTEN VERSION (write ONLY the rewritten text):"
+)
+
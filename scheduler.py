@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class SchedulerBusy(Exception):
+    """Raised when a generation request is shed instead of queued"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueTimeout(SchedulerBusy):
+    """Raised when a queued request's deadline passes before it gets a slot"""
+
+
+class Ticket:
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.enqueued_at = time.monotonic()
+        self.granted = threading.Event()
+
+
+class GenerationScheduler:
+    """Bounded-concurrency admission control for LLM generation.
+
+    At most `max_in_flight` generations run at once. Extra requests wait in a
+    bounded queue served round-robin across chat ids so one busy chat cannot
+    starve the others; when the queue is full, or a request's deadline passes
+    while waiting, SchedulerBusy is raised with a retry-after hint. Background
+    callers can pass a smaller `max_queue` so they never take the last queue
+    places from interactive traffic.
+    """
+
+    def __init__(self, max_in_flight=2, max_queue=16, default_timeout=30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.lock = threading.Lock()
+        self.queues = OrderedDict()  # chat id -> deque of waiting tickets, in round-robin order
+        self.queued = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_service = 0.0
+        self.completed = 0
+
+    def retry_after(self):
+        """Seconds a shed client should wait, estimated from recent service times"""
+        average = self.total_service / self.completed if self.completed else 1.0
+        return max(1, math.ceil(average * (self.queued + 1) / self.max_in_flight))
+
+    def run(self, fn, chat_id='', timeout=None, max_queue=None):
+        """Run fn once a generation slot is free and return its result"""
+        timeout = self.default_timeout if timeout is None else timeout
+        max_queue = self.max_queue if max_queue is None else min(max_queue, self.max_queue)
+        self._admit(chat_id, timeout, max_queue)
+        started = time.monotonic()
+        try:
+            return fn()
+        finally:
+            self._release(time.monotonic() - started)
+
+    def _admit(self, chat_id, timeout, max_queue):
+        ticket = Ticket(chat_id)
+        with self.lock:
+            if self.in_flight < self.max_in_flight and not self.queued:
+                self._grant(ticket)
+                return ticket
+            if self.queued >= max_queue:
+                self.rejected += 1
+                raise SchedulerBusy("Generation queue is full", self.retry_after())
+            self.queues.setdefault(chat_id, deque()).append(ticket)
+            self.queued += 1
+
+        if ticket.granted.wait(timeout):
+            return ticket
+
+        with self.lock:
+            # The slot may have been handed over right as the wait timed out
+            if ticket.granted.is_set():
+                return ticket
+            queue = self.queues.get(chat_id)
+            queue.remove(ticket)
+            if not queue:
+                del self.queues[chat_id]
+            self.queued -= 1
+            self.timed_out += 1
+            raise QueueTimeout("Timed out waiting for a generation slot", self.retry_after())
+
+    def _grant(self, ticket):
+        wait = time.monotonic() - ticket.enqueued_at
+        self.in_flight += 1
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        ticket.granted.set()
+
+    def _release(self, service_time):
+        with self.lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_service += service_time
+            while self.queued and self.in_flight < self.max_in_flight:
+                # Next chat in round-robin order gives up its oldest ticket
+                chat_id, queue = next(iter(self.queues.items()))
+                ticket = queue.popleft()
+                if queue:
+                    self.queues.move_to_end(chat_id)
+                else:
+                    del self.queues[chat_id]
+                self.queued -= 1
+                self._grant(ticket)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'queue_depth': self.queued,
+                'max_queue': self.max_queue,
+                'waiting_chats': len(self.queues),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_wait': self.total_wait / self.admitted if self.admitted else 0.0,
+                'max_wait': self.max_wait,
+                'avg_service': self.total_service / self.completed if self.completed else 0.0
+            }
@@ -0,0 +1,159 @@
+import re
+import sys
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Rabin-Karp parameters: Mersenne prime modulus and an odd base
+HASH_MODULUS = (1 << 61) - 1
+HASH_BASE = 1000003
+
+# Amortised heap cost of one dict entry (hash, key and value slots plus the index)
+DICT_ENTRY_BYTES = 48
+
+
+def tokenize(text):
+    """Casefolded word tokens with their (start, end) character offsets"""
+    return [(m.group().casefold(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+
+
+def token_hash(token):
+    return hash(token) % HASH_MODULUS
+
+
+class ShingleIndex:
+    """Rolling-hash index of token n-grams from forgotten statements.
+
+    Statements of at least `ngram` tokens are shingled into windows of that
+    many tokens; shorter lines are too generic to call a copy and are left to
+    the similarity check. Scanning a text is one rolling pass, so verbatim
+    copies are found in linear time without any embedding work. A copied run
+    is only reported once it covers `min_fraction` of a statement it matches
+    or two full windows, so a stock phrase shared with a long statement is
+    not treated as a leak.
+
+    Each shingle maps to a small integer statement id, with a set only for
+    the rare shingles several statements share, so the table costs a few
+    dozen bytes per shingle rather than a container of strings.
+    """
+
+    def __init__(self, ngram=8, min_fraction=0.5):
+        self.ngram = ngram
+        self.min_fraction = min_fraction
+        self.shingles = {}  # hash -> statement id, or a set of ids when statements share it
+        self.ids = {}       # statement -> id
+        self.entries = {}   # id -> (statement, token count)
+        self.next_id = 0
+        self.nbytes = 0     # heap held by the table, kept up to date on every add and remove
+
+    def _window_hashes(self, hashes, size):
+        """Yield (start, hash) for every window of `size` consecutive token hashes"""
+        if len(hashes) < size:
+            return
+        high = pow(HASH_BASE, size - 1, HASH_MODULUS)
+        h = 0
+        for value in hashes[:size]:
+            h = (h * HASH_BASE + value) % HASH_MODULUS
+        yield 0, h
+        for start in range(1, len(hashes) - size + 1):
+            h = (h - hashes[start - 1] * high) % HASH_MODULUS
+            h = (h * HASH_BASE + hashes[start + size - 1]) % HASH_MODULUS
+            yield start, h
+
+    def _statement_shingles(self, statement):
+        hashes = [token_hash(tok) for tok, _, _ in tokenize(statement)]
+        return len(hashes), {h for _, h in self._window_hashes(hashes, self.ngram)}
+
+    def add(self, statement):
+        if statement in self.ids:
+            return
+        length, hashes = self._statement_shingles(statement)
+        if not hashes:
+            return
+        statement_id = self.next_id
+        self.next_id += 1
+        self.ids[statement] = statement_id
+        self.entries[statement_id] = entry = (statement, length)
+        self.nbytes += self._entry_bytes(statement_id, entry)
+        for h in hashes:
+            holders = self.shingles.get(h)
+            if holders is None:
+                self.shingles[h] = statement_id
+                self.nbytes += sys.getsizeof(h) + DICT_ENTRY_BYTES
+            elif isinstance(holders, set):
+                before = sys.getsizeof(holders)
+                holders.add(statement_id)
+                self.nbytes += sys.getsizeof(holders) - before
+            else:
+                holders = self.shingles[h] = {holders, statement_id}
+                self.nbytes += sys.getsizeof(holders)
+
+    def remove(self, statement):
+        statement_id = self.ids.pop(statement, None)
+        if statement_id is None:
+            return
+        self.nbytes -= self._entry_bytes(statement_id, self.entries.pop(statement_id))
+        _, hashes = self._statement_shingles(statement)
+        for h in hashes:
+            holders = self.shingles.get(h)
+            if isinstance(holders, set):
+                before = sys.getsizeof(holders)
+                holders.discard(statement_id)
+                if len(holders) == 1:
+                    self.shingles[h] = holders.pop()
+                    self.nbytes -= before
+                else:
+                    self.nbytes += sys.getsizeof(holders) - before
+            elif holders == statement_id:
+                del self.shingles[h]
+                self.nbytes -= sys.getsizeof(h) + DICT_ENTRY_BYTES
+
+    @staticmethod
+    def _entry_bytes(statement_id, entry):
+        # ids and entries slots, the id and the (statement, length) tuple; the text belongs to the caller
+        return 2 * DICT_ENTRY_BYTES + sys.getsizeof(statement_id) + sys.getsizeof(entry)
+
+    def scan(self, text):
+        """Return merged spans of text that copy indexed statements verbatim.
+
+        Each span is a dict with character `start`/`end`, the copied `text`,
+        its length in `tokens` and the forgotten `statements` it matched.
+        """
+        if not self.shingles:
+            return []
+        tokens = tokenize(text)
+        hashes = [token_hash(tok) for tok, _, _ in tokens]
+
+        runs = []
+        for start, h in self._window_hashes(hashes, self.ngram):
+            holders = self.shingles.get(h)
+            if holders is None:
+                continue
+            holders = holders if isinstance(holders, set) else (holders,)
+            end = start + self.ngram
+            if runs and start <= runs[-1][1]:
+                runs[-1][1] = end
+                runs[-1][2].update(holders)
+            else:
+                runs.append([start, end, set(holders)])
+
+        spans = []
+        for start, end, holders in runs:
+            length = end - start
+            matched = [self.entries[statement_id] for statement_id in holders]
+            if length < 2 * self.ngram and not any(
+                length >= self.min_fraction * count for _, count in matched
+            ):
+                continue
+            char_start, char_end = tokens[start][1], tokens[end - 1][2]
+            spans.append({
+                'start': char_start,
+                'end': char_end,
+                'text': text[char_start:char_end],
+                'tokens': length,
+                'statements': sorted(stmt for stmt, _ in matched)
+            })
+        return spans
+
+    def memory_bytes(self):
+        """Approximate Python heap held by the shingle table, statement text excluded"""
+        return self.nbytes
@@ -0,0 +1,42 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_local = threading.local()
+
+
+@contextmanager
+def collect_stage_times():
+    """Collect inclusive wall time per pipeline stage for work done on this thread"""
+    times = {}
+    previous = getattr(_local, 'times', None)
+    _local.times = times
+    try:
+        yield times
+    finally:
+        _local.times = previous
+
+
+def add_stage_time(name, seconds):
+    """Add seconds to a stage in the active stage-time collector, if any"""
+    times = getattr(_local, 'times', None)
+    if times is not None:
+        times[name] = times.get(name, 0.0) + seconds
+
+
+def timed_stage(name):
+    """Decorator adding a call's duration to the active stage-time collector, if any"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            times = getattr(_local, 'times', None)
+            if times is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                times[name] = times.get(name, 0.0) + time.perf_counter() - start
+        return wrapper
+    return decorator
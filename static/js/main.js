@@ -182,10 +182,28 @@ async function handleFiles(files) {
     }
 }
 
+// Files requested per /get-forgetting-set page
+const FORGETTING_SET_PAGE_SIZE = 100;
+
+async function fetchForgettingSetItems() {
+    // Walk the paginated listing until every file has been fetched
+    const items = [];
+    let total = 0;
+    do {
+        const response = await fetch(`/get-forgetting-set?offset=${items.length}&limit=${FORGETTING_SET_PAGE_SIZE}`);
+        const data = await response.json();
+        if (!data.items || data.items.length === 0) {
+            break;
+        }
+        items.push(...data.items);
+        total = data.total;
+    } while (items.length < total);
+    return items;
+}
+
 async function loadForgettingSet() {
     try {
-        const response = await fetch('/get-forgetting-set');
-        const data = await response.json();
+        const data = { items: await fetchForgettingSetItems() };
         
         const listContainer = document.getElementById('forgettingSetList');
         const emptyState = document.getElementById('emptyState');
@@ -200,18 +218,21 @@ async function loadForgettingSet() {
             // Hide empty state if we have files
             emptyState.style.display = 'none';
             
-            data.items.forEach((item, index) => {
+            data.items.forEach(item => {
                 const itemElement = document.createElement('div');
                 itemElement.className = 'file-item';
                 itemElement.innerHTML = `
                     <i class="fas fa-file-alt file-icon"></i>
-                    <div class="file-name">${item.filename}</div>
+                    <div class="file-name"></div>
                     <div class="file-actions">
-                        <button class="file-action-btn" onclick="deleteItem(${index})">
+                        <button class="file-action-btn">
                             <i class="fas fa-trash"></i>
                         </button>
                     </div>
                 `;
+                // Filenames may hold quotes or markup, so they never go through innerHTML
+                itemElement.querySelector('.file-name').textContent = item.filename;
+                itemElement.querySelector('.file-action-btn').addEventListener('click', () => deleteItem(item.filename));
                 listContainer.appendChild(itemElement);
             });
         } else {
@@ -223,9 +244,9 @@ async function loadForgettingSet() {
     }
 }
 
-async function deleteItem(index) {
+async function deleteItem(filename) {
     try {
-        const response = await fetch(`/delete-forgetting-item/${index}`, {
+        const response = await fetch(`/delete-forgetting-file/${encodeURIComponent(filename)}`, {
             method: 'DELETE'
         });
         
@@ -0,0 +1,205 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import torch
+
+from aliases import DerivedAliases, alias_table
+
+DEFAULT_TENANT = 'default'
+
+TENANT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def validate_tenant_id(tenant_id):
+    """Return a usable tenant id, raising ValueError for unsafe ones"""
+    if not tenant_id:
+        return DEFAULT_TENANT
+    if not TENANT_ID_PATTERN.match(tenant_id):
+        raise ValueError(f"Invalid tenant id: {tenant_id}")
+    return tenant_id
+
+
+class TenantState:
+    """Everything one tenant's forgetting set owns"""
+
+    def __init__(self, forgetting_index, upload_dir):
+        self.forgetting_index = forgetting_index
+        self.upload_dir = upload_dir
+        self.uploaded_files = {}  # filename -> file metadata, in upload order
+        self.entity_aliases = {}
+        self.derived_aliases = DerivedAliases()
+        self.files_lock = threading.RLock()
+
+    def state_dict(self):
+        with self.files_lock:
+            return {
+                'index': self.forgetting_index.state_dict(),
+                'uploaded_files': self.uploaded_files,
+                'entity_aliases': self.entity_aliases,
+                'derived_aliases': self.derived_aliases.state_dict()
+            }
+
+    def load_state_dict(self, state):
+        with self.files_lock:
+            self.forgetting_index.load_state_dict(state['index'])
+            self.uploaded_files = state['uploaded_files']
+            # Older spill files hold raw alias lists; canonicalize them on load
+            self.entity_aliases = {
+                name: alias_table(aliases) for name, aliases in state['entity_aliases'].items()
+            }
+            # Older spill files carry no mention counts; their tables stay as saved until re-ingested
+            self.derived_aliases = DerivedAliases()
+            if 'derived_aliases' in state:
+                self.derived_aliases.load_state_dict(state['derived_aliases'])
+
+
+class TenantRegistry:
+    """Per-tenant forgetting state with LRU spilling of cold tenants to disk.
+
+    Resident tenants are kept in recency order. Whenever their combined
+    memory exceeds `memory_budget` bytes, the least recently used tenants
+    that no request is currently using are saved to `spill_dir` and dropped;
+    they are reloaded lazily on their next request. Tenants with no spill
+    file yet are handed to `bootstrap` to be built from scratch.
+
+    Loading, bootstrapping and spilling run outside the registry lock, so a
+    slow tenant never holds up requests for the others. A tenant that is
+    being loaded or spilled has a future in `pending` that later requests
+    for it wait on.
+    """
+
+    def __init__(self, factory, spill_dir, memory_budget, bootstrap=None):
+        self.factory = factory
+        self.bootstrap = bootstrap
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.lock = threading.RLock()
+        self.resident = OrderedDict()  # tenant id -> TenantState
+        self.pins = {}                 # tenant id -> in-flight users
+        self.pending = {}              # tenant id -> Future of a load or spill in progress
+
+    def _spill_path(self, tenant_id):
+        return os.path.join(self.spill_dir, f"{tenant_id}.pt")
+
+    def acquire(self, tenant_id):
+        """Pin a tenant in memory, loading or creating it as needed"""
+        while True:
+            with self.lock:
+                state = self.resident.get(tenant_id)
+                if state is not None:
+                    victims = self._pin(tenant_id)
+                    break
+                future = self.pending.get(tenant_id)
+                loading = future is None
+                if loading:
+                    future = self.pending[tenant_id] = Future()
+            if not loading:
+                # Another request is loading or spilling this tenant
+                future.result()
+                continue
+            try:
+                state = self._load(tenant_id)
+            except Exception as e:
+                with self.lock:
+                    del self.pending[tenant_id]
+                future.set_exception(e)
+                raise
+            with self.lock:
+                del self.pending[tenant_id]
+                self.resident[tenant_id] = state
+                victims = self._pin(tenant_id)
+            future.set_result(state)
+            break
+        self._spill(victims)
+        return state
+
+    def _pin(self, tenant_id):
+        self.resident.move_to_end(tenant_id)
+        self.pins[tenant_id] = self.pins.get(tenant_id, 0) + 1
+        return self._select_victims()
+
+    def _load(self, tenant_id):
+        """Reload a tenant's spill, rebuilding it from scratch if that fails.
+
+        Raises when neither works: an empty forgetting set would silently let
+        everything the tenant asked to forget through.
+        """
+        path = self._spill_path(tenant_id)
+        if os.path.exists(path):
+            state = self.factory(tenant_id)
+            try:
+                state.load_state_dict(torch.load(path, weights_only=False))
+                # Resident state is authoritative from here on
+                os.remove(path)
+                print(f"Reloaded tenant {tenant_id} from {path}")
+                return state
+            except Exception as e:
+                if self.bootstrap is None:
+                    raise RuntimeError(f"Could not reload tenant {tenant_id}: {e}") from e
+                # Keep the unreadable spill aside so a later eviction can't overwrite it
+                os.replace(path, path + '.bad')
+                print(f"Error reloading tenant {tenant_id}, rebuilding from its uploads: {e}")
+        state = self.factory(tenant_id)
+        if self.bootstrap is not None:
+            self.bootstrap(tenant_id, state)
+        return state
+
+    def release(self, tenant_id):
+        with self.lock:
+            count = self.pins.get(tenant_id, 0) - 1
+            if count > 0:
+                self.pins[tenant_id] = count
+            else:
+                self.pins.pop(tenant_id, None)
+            victims = self._select_victims()
+        self._spill(victims)
+
+    def resident_bytes(self):
+        with self.lock:
+            return sum(state.forgetting_index.memory_bytes() for state in self.resident.values())
+
+    def _select_victims(self):
+        """Take unpinned LRU tenants out of residence until within budget; lock must be held.
+
+        Sizes are read from each index's running byte count, never taking its lock.
+        """
+        total = self.resident_bytes()
+        victims = []
+        for tenant_id in list(self.resident):
+            if total <= self.memory_budget:
+                break
+            if tenant_id in self.pins or tenant_id in self.pending:
+                continue
+            state = self.resident.pop(tenant_id)
+            size = state.forgetting_index.memory_bytes()
+            future = self.pending[tenant_id] = Future()
+            victims.append((tenant_id, state, size, future))
+            total -= size
+        return victims
+
+    def _spill(self, victims):
+        for tenant_id, state, size, future in victims:
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                torch.save(state.state_dict(), self._spill_path(tenant_id))
+                print(f"Evicted tenant {tenant_id} ({size} bytes) to disk")
+                state = None
+            except Exception as e:
+                print(f"Error spilling tenant {tenant_id}: {e}")
+            with self.lock:
+                del self.pending[tenant_id]
+                if state is not None:
+                    # Keep it resident, as least recently used, rather than lose it
+                    self.resident[tenant_id] = state
+                    self.resident.move_to_end(tenant_id, last=False)
+            future.set_result(None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'resident': list(self.resident),
+                'resident_bytes': self.resident_bytes(),
+                'memory_budget': self.memory_budget
+            }
@@ -0,0 +1,125 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backends import BackendPool, BackendRequestError, BackendUnavailable
+
+
+class StubOllama:
+    """Local HTTP server answering /api/generate and /api/tags like Ollama"""
+
+    def __init__(self, status=200, delay=0.0):
+        self.status = status
+        self.delay = delay
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.requests += 1
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if stub.delay:
+                    threading.Event().wait(stub.delay)
+                if stub.status == 200:
+                    payload = {'response': f"echo: {body['prompt']}", 'prompt_eval_count': 3,
+                               'prompt_eval_duration': 2000000}
+                else:
+                    payload = {'error': f"model '{body['model']}' not found"}
+                self._reply(stub.status, payload)
+
+            def do_GET(self):
+                self._reply(200, {'models': []})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BackendPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.stubs = []
+
+    def tearDown(self):
+        for stub in self.stubs:
+            stub.close()
+
+    def stub(self, **kwargs):
+        stub = StubOllama(**kwargs)
+        self.stubs.append(stub)
+        return stub
+
+    def health(self, pool):
+        return {b['url']: b['healthy'] for b in pool.stats()}
+
+    def test_spreads_requests_and_records_prefill(self):
+        a, b = self.stub(), self.stub()
+        pool = BackendPool([a.url, b.url])
+        for _ in range(4):
+            self.assertEqual(pool.generate("hi", "llama3.2"), "echo: hi")
+        self.assertEqual((a.requests, b.requests), (2, 2))
+        self.assertAlmostEqual(pool.stats()[0]['avg_prefill_ms'], 2.0)
+
+    def test_client_error_fails_without_ejecting(self):
+        a, b = self.stub(status=404), self.stub(status=404)
+        pool = BackendPool([a.url, b.url])
+        with self.assertRaises(BackendRequestError):
+            pool.generate("hi", "no-such-model")
+        self.assertEqual(a.requests + b.requests, 1)
+        self.assertEqual(set(self.health(pool).values()), {True})
+
+    def test_server_error_ejects_and_retries(self):
+        broken, good = self.stub(status=500), self.stub()
+        pool = BackendPool([broken.url, good.url])
+        for _ in range(2):
+            self.assertEqual(pool.generate("hi", "llama3.2"), "echo: hi")
+        self.assertEqual(self.health(pool), {broken.url: False, good.url: True})
+
+        # Its /api/tags still answers, so the health check brings it back
+        pool.check_health()
+        self.assertTrue(self.health(pool)[broken.url])
+
+    def test_unreachable_backend_stays_ejected(self):
+        good = self.stub()
+        down = self.stub()
+        down.close()
+        self.stubs.remove(down)
+        pool = BackendPool([down.url, good.url])
+        self.assertEqual(pool.generate("hi", "llama3.2"), "echo: hi")
+        self.assertFalse(self.health(pool)[down.url])
+
+        pool.check_health()
+        self.assertFalse(self.health(pool)[down.url])
+        self.assertTrue(self.health(pool)[good.url])
+
+    def test_read_timeout_keeps_backend(self):
+        slow = self.stub(delay=0.5)
+        pool = BackendPool([slow.url], timeout=0.1)
+        with self.assertRaises(BackendRequestError):
+            pool.generate("hi", "llama3.2")
+        self.assertTrue(self.health(pool)[slow.url])
+
+    def test_no_backend_left(self):
+        broken = self.stub(status=503)
+        pool = BackendPool([broken.url])
+        with self.assertRaises(BackendUnavailable):
+            pool.generate("hi", "llama3.2")
+
+
+if __name__ == '__main__':
+    unittest.main()
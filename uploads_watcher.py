@@ -0,0 +1,80 @@
+import os
+import threading
+
+
+class UploadsWatcher:
+    """Poll a directory and report added, changed and deleted files.
+
+    Keeps a manifest of (mtime, size) per filename so every scan is a single
+    scandir pass and callbacks only fire for files that actually changed. A
+    file only enters the manifest once its callback succeeds (returns anything
+    but False), so a failed load is retried on the next scan.
+    """
+
+    def __init__(self, folder, on_added, on_changed, on_removed, interval=2.0):
+        self.folder = folder
+        self.on_added = on_added
+        self.on_changed = on_changed
+        self.on_removed = on_removed
+        self.interval = interval
+        self.manifest = {}
+        self.lock = threading.Lock()  # held while a file is dispatched, so it is never synced twice
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def scan(self):
+        """Diff the directory against the manifest and dispatch callbacks"""
+        current = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        current[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except Exception as e:
+            print(f"Error scanning {self.folder}: {e}")
+            return
+
+        for filename, signature in current.items():
+            self._sync(filename, signature)
+        with self.lock:
+            removed = [filename for filename in self.manifest if filename not in current]
+            for filename in removed:
+                self._dispatch(self.on_removed, filename)
+                del self.manifest[filename]
+
+    def sync(self, filename):
+        """Dispatch a file now rather than on the next scan, returning whether it succeeded"""
+        stat = os.stat(os.path.join(self.folder, filename))
+        return self._sync(filename, (stat.st_mtime_ns, stat.st_size))
+
+    def _sync(self, filename, signature):
+        with self.lock:
+            previous = self.manifest.get(filename)
+            if previous == signature:
+                return True
+            callback = self.on_added if previous is None else self.on_changed
+            if not self._dispatch(callback, filename):
+                return False
+            self.manifest[filename] = signature
+            return True
+
+    def _dispatch(self, callback, filename):
+        try:
+            return callback(filename) is not False
+        except Exception as e:
+            print(f"Error handling change to {filename}: {e}")
+            return False
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.scan()